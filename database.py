@@ -2,20 +2,513 @@
 Database configuration and operations for the Telegram PNL Bot
 """
 
+import bisect
+import copy
+import functools
+import importlib.util
+import itertools
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
-import re
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import numpy as np
+
+from pymongo import MongoClient, IndexModel, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure, PyMongoError
 from bson import ObjectId
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the entry point (the bot or a maintenance script)
 logger = logging.getLogger(__name__)
 
+# Read-mostly query results are served from memory for this many seconds
+LEADERBOARD_CACHE_TTL = 30
+ROLLUP_CACHE_TTL = 15
+STATS_CACHE_TTL = 60
+TRENDS_CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 256
+
+# Materialized leaderboards are rebuilt from the rollups this often (seconds), keeping this many ranks
+LEADERBOARD_REFRESH_INTERVAL = 120
+MATERIALIZED_LEADERBOARD_SIZE = 100
+# After a write, the next refresh is brought forward to at most this many seconds away
+LEADERBOARD_WRITE_REFRESH_DELAY = 5
+
+# Bump when a new backfill is added; the completed version is recorded in global_stats
+BACKFILL_VERSION = 1
+
+# Per-user stats, with the ratios computed server-side so results need no post-processing
+_USER_STATS_GROUP_STAGE = {
+    '$group': {
+        '_id': None,
+        'total_trades': {'$sum': 1},
+        'total_profit_usd': {'$sum': '$profit_usd'},
+        'total_profit_sol': {'$sum': '$profit_sol'},
+        'total_investment_usd': {'$sum': '$investment_usd'},
+        'winning_trades': {
+            '$sum': {
+                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+            }
+        },
+        'losing_trades': {
+            '$sum': {
+                '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
+            }
+        },
+        'best_trade': {'$max': '$profit_usd'},
+        'worst_trade': {'$min': '$profit_usd'},
+        'avg_profit': {'$avg': '$profit_usd'},
+        'unique_tokens': {'$addToSet': '$ticker'}
+    }
+}
+
+_USER_STATS_DERIVED_STAGE = {
+    '$addFields': {
+        'win_rate': {
+            '$cond': [
+                {'$gt': ['$total_trades', 0]},
+                {'$multiply': [{'$divide': ['$winning_trades', '$total_trades']}, 100]},
+                0
+            ]
+        },
+        'roi': {
+            '$cond': [
+                {'$gt': ['$total_investment_usd', 0]},
+                {'$multiply': [{'$divide': ['$total_profit_usd', '$total_investment_usd']}, 100]},
+                0
+            ]
+        },
+        'token_count': {'$size': '$unique_tokens'}
+    }
+}
+
+# Columns included in a user's CSV export (internal derived fields and file ids are left out)
+_EXPORT_PROJECTION = {
+    '_id': 0,
+    'user_id': 1,
+    'username': 1,
+    'ticker': 1,
+    'initial_investment': 1,
+    'investment_usd': 1,
+    'investment_sol': 1,
+    'profit_usd': 1,
+    'profit_sol': 1,
+    'percent_gain': 1,
+    'currency': 1,
+    'timestamp': 1
+}
+
+# Fields a trading history row shows
+_HISTORY_PROJECTION = {
+    '_id': 0,
+    'ticker': 1,
+    'initial_investment': 1,
+    'profit_usd': 1,
+    'profit_sol': 1,
+    'timestamp': 1
+}
+
+# Achievement tiers per user stat: ascending thresholds (reached at >=) and their labels
+_ACHIEVEMENT_TIERS = (
+    ('total_trades', (1, 10, 50, 100),
+     ("🎯 First Trade", "🔟 Ten Trades", "📊 Active Trader", "💎 Trading Veteran")),
+    ('total_profit_usd', (100, 1000, 10000),
+     ("💰 First $100", "🚀 Thousand Club", "🏆 Ten K Club")),
+    ('win_rate', (50, 70, 90),
+     ("⚖️ Balanced Trader", "🎯 Sharp Shooter", "👑 Almost Perfect")),
+    ('roi', (50, 100),
+     ("📈 Growth Hacker", "🔥 Double Down")),
+)
+
+# Milestone tiers per user stat, in the order milestones are offered: targets, names, rewards
+_MILESTONE_TIERS = (
+    ('total_trades', (1, 5, 10),
+     ('First Trade', 'Five Trades', 'Ten Trades'), ('🎯', '🏃', '🔟')),
+    ('total_profit_usd', (1, 100, 500, 1000),
+     ('First Profit', '$100 Club', '$500 Club', '$1000 Club'), ('💰', '💯', '🚀', '💎')),
+    ('win_rate', (50, 70),
+     ('50% Win Rate', '70% Win Rate'), ('⚖️', '🎯')),
+)
+
+# Goals suggested as the next milestone, first unmet one wins
+_NEXT_MILESTONES = (
+    ('total_trades', 1, "First Trade"),
+    ('total_trades', 10, "Reach 10 trades ({remaining} to go)"),
+    ('total_profit_usd', 100, "Reach $100 profit (${remaining:.2f} to go)"),
+    ('total_profit_usd', 1000, "Reach $1000 profit (${remaining:.2f} to go)"),
+    ('win_rate', 70, "Reach 70% win rate ({remaining:.1f}% to go)"),
+)
+
+# Per-token totals behind the portfolio view
+_PORTFOLIO_GROUP_STAGE = {
+    '$group': {
+        '_id': '$ticker',
+        'trade_count': {'$sum': 1},
+        'total_profit': {'$sum': '$profit_usd'},
+        'total_investment': {'$sum': '$initial_investment'}
+    }
+}
+
+# Combined battle points, stored on each battle_points record for the overall leaderboard
+_BATTLE_TOTAL_POINTS_EXPR = {
+    '$add': [{'$ifNull': ['$profit_battle_points', 0]}, {'$ifNull': ['$trade_war_points', 0]}]
+}
+
+# Battle points for 1st, 2nd and 3rd place; everyone else earns participation points
+_RANK_POINTS = (100, 75, 50)
+_PARTICIPATION_POINTS = 25
+
+# Fields the battle leaderboard and history views render
+_BATTLE_LEADERBOARD_PROJECTION = {
+    '_id': 0,
+    'username': 1,
+    'profit_battle_points': 1,
+    'trade_war_points': 1,
+    'total_points': 1,
+    'battles_won': 1,
+    'total_battles': 1
+}
+_BATTLE_HISTORY_PROJECTION = {
+    '_id': 0,
+    'type': 1,
+    'participants': 1,
+    'status': 1,
+    'start_date': 1,
+    'end_date': 1,
+    'created_at': 1
+}
+
+# Streaks reported for a user without trades
+_NO_STREAKS = {
+    'current_streak': 0,
+    'longest_win_streak': 0,
+    'longest_loss_streak': 0,
+    'streak_type': 'neutral'
+}
+
+# Request-path aggregations fail fast instead of spilling to disk or stalling the bot;
+# set MONGODB_AGG_ALLOW_DISK_USE=true to let them spill once groups outgrow the memory limit
+_AGG_OPTS = {
+    'allowDiskUse': os.getenv('MONGODB_AGG_ALLOW_DISK_USE', 'false').lower() == 'true',
+    'maxTimeMS': 3000
+}
+
+# Background rebuilds group every trade and may always spill to disk
+_BACKGROUND_AGG_OPTS = {'allowDiskUse': True}
+
+# Backfill updates are sent to the server in bulk writes of this many operations
+WRITE_BATCH_SIZE = 500
+
+_DUPLICATE_KEY_ERROR = 11000
+_UNRECOGNIZED_STAGE_ERROR = 40324
+
+# Stored fields derived from each record, with the expressions used to backfill them
+# (username_lc is backfilled in Python: $toLower only lowercases ASCII)
+_DERIVED_FIELD_EXPRS = {
+    'percent_gain': {
+        '$cond': [
+            {'$gt': ['$initial_investment', 0]},
+            {
+                '$multiply': [
+                    {'$divide': ['$profit_usd', '$initial_investment']},
+                    100
+                ]
+            },
+            None
+        ]
+    },
+    'is_win': {'$gt': ['$profit_usd', 0]},
+    'dow': {'$dayOfWeek': '$timestamp'},
+    'hour': {'$hour': '$timestamp'}
+}
+
+# $dayOfWeek/$hour fail on non-date timestamps, which would abort the whole backfill
+_DERIVED_FIELD_FILTERS = {
+    'dow': {'timestamp': {'$type': 'date'}},
+    'hour': {'timestamp': {'$type': 'date'}}
+}
+
+# Shared leaderboard stages, built once at import instead of on every call; users are
+# grouped on the stored username_lc, so no per-document normalization runs
+_LEADERBOARD_GROUP_STAGE = {
+    '$group': {
+        '_id': '$username_lc',
+        'username': {'$first': '$username'},  # Keep original username for display
+        'total_profit_usd': {'$sum': '$profit_usd'},
+        'total_profit_sol': {'$sum': '$profit_sol'},
+        'trade_count': {'$sum': 1},
+        'winning_trades': {
+            '$sum': {
+                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+            }
+        },
+        'total_investment': {'$sum': '$initial_investment'},
+        'avg_profit_per_trade': {'$avg': '$profit_usd'}
+    }
+}
+
+_LEADERBOARD_DERIVED_STAGE = {
+    '$addFields': {
+        'win_rate': {
+            '$multiply': [
+                {'$divide': ['$winning_trades', '$trade_count']},
+                100
+            ]
+        },
+        'roi': {
+            '$cond': [
+                {'$gt': ['$total_investment', 0]},
+                {
+                    '$multiply': [
+                        {'$divide': ['$total_profit_usd', '$total_investment']},
+                        100
+                    ]
+                },
+                0
+            ]
+        }
+    }
+}
+
+# Win rate of a per-user rollup document, exposed under the field names the live boards use
+_ROLLUP_WIN_RATE_STAGE = {
+    '$addFields': {
+        'total_trades': '$trade_count',
+        'win_rate': {
+            '$multiply': [
+                {'$divide': ['$winning_trades', '$trade_count']},
+                100
+            ]
+        }
+    }
+}
+
+# Materialized leaderboard categories: stages applied to pnl_rollups and the ranking sort
+_MATERIALIZED_LEADERBOARDS = {
+    'profit': (
+        [],
+        {'total_profit_usd': -1}
+    ),
+    'roi': (
+        [
+            {'$match': {'total_investment': {'$gt': 0}}},
+            {
+                '$addFields': {
+                    'roi_percentage': {
+                        '$multiply': [
+                            {'$divide': ['$total_profit_usd', '$total_investment']},
+                            100
+                        ]
+                    }
+                }
+            }
+        ],
+        {'roi_percentage': -1}
+    ),
+    'whales': (
+        [{'$match': {'max_investment': {'$gt': 0}}}],
+        {'max_investment': -1}
+    ),
+    'consistency': (
+        [{'$match': {'trade_count': {'$gte': 3}}}, _ROLLUP_WIN_RATE_STAGE],
+        {'win_rate': -1, 'total_profit_usd': -1}
+    ),
+    'trade_count': (
+        [_ROLLUP_WIN_RATE_STAGE],
+        {'trade_count': -1}
+    ),
+    'precision': (
+        [{'$match': {'trade_count': {'$gte': 10}}}, _ROLLUP_WIN_RATE_STAGE],
+        {'win_rate': -1}
+    )
+}
+
+# Wire compressors in preference order; zstd/snappy only when their modules are installed
+_COMPRESSORS = ','.join(
+    [name for name, module in (('zstd', 'zstandard'), ('snappy', 'snappy')) if importlib.util.find_spec(module)] +
+    ['zlib']
+)
+
+# One MongoClient (and so one connection pool) per server, shared process-wide
+_CLIENTS: Dict[tuple, MongoClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+def _get_client(host: str, port: int) -> MongoClient:
+    """Return the shared MongoClient for host:port, creating it on first use"""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get((host, port))
+        if client is None:
+            client = MongoClient(
+                host,
+                port,
+                maxPoolSize=int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+                minPoolSize=5,
+                maxIdleTimeMS=300000,  # Recycle sockets idle for five minutes
+                # Fail a handler fast when every pooled connection is busy instead of queueing indefinitely
+                waitQueueTimeoutMS=int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '2500')),
+                serverSelectionTimeoutMS=2000,
+                compressors=_COMPRESSORS,
+                retryWrites=True,
+                retryReads=True,
+                appname='telegrampnl'  # Identifies the bot's connections in server logs and currentOp
+            )
+            _CLIENTS[(host, port)] = client
+        return client
+
+def _close_client(host: str, port: int):
+    """Close and forget the shared MongoClient for host:port"""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.pop((host, port), None)
+    if client:
+        client.close()
+
+def normalize_username(username: str) -> str:
+    """Normalize a username the same way the leaderboard pipelines do (drop leading @, lowercase)"""
+    username = username or ''
+    return (username[1:] if username.startswith('@') else username).lower()
+
+@functools.lru_cache(maxsize=512)
+def _day_bounds(day_ordinal: int) -> Tuple[datetime, datetime]:
+    """Half-open UTC [start, end) range for the day with the given proleptic ordinal"""
+    start = datetime.fromordinal(day_ordinal).replace(tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+@functools.lru_cache(maxsize=512)
+def _month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """Half-open UTC [start, end) range for a calendar month"""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc) if month == 12 else datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+def _streaks_from_profits(profits: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Win/loss streaks of chronologically ordered trade profits; None when there are no trades"""
+    if profits.size == 0:
+        return None
+    
+    wins = profits > 0
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(wins.astype(np.int8))) + 1))
+    run_lengths = np.diff(np.append(run_starts, wins.size))
+    run_wins = wins[run_starts]
+    return {
+        'current_streak': int(run_lengths[-1]),
+        'longest_win_streak': int(run_lengths[run_wins].max(initial=0)),
+        'longest_loss_streak': int(run_lengths[~run_wins].max(initial=0)),
+        'streak_type': 'winning' if run_wins[-1] else 'losing'
+    }
+
+def _portfolio_from_tokens(tokens: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Portfolio summary from per-token totals; None when there are no tokens"""
+    if not tokens:
+        return None
+    
+    # A user trades few distinct tokens, so ordering them here is cheaper than a server-side sort
+    tokens.sort(key=lambda token: token['total_profit'], reverse=True)
+    return {
+        'tokens': tokens,
+        'total_tokens': len(tokens),
+        'total_profit': sum(token['total_profit'] for token in tokens),
+        'total_investment': sum(token['total_investment'] for token in tokens),
+        'diversification_score': min(len(tokens) * 10, 100)  # Simple score
+    }
+
+def _battle_points_update(battle_type: str, points: int, won: bool, now: datetime) -> List[Dict[str, Any]]:
+    """Pipeline update adding one battle result to a user's points, upserting a fresh record"""
+    points_field = 'profit_battle_points' if battle_type == 'profit' else 'trade_war_points'
+    
+    def add(field: str, amount: int) -> Dict[str, Any]:
+        return {'$add': [{'$ifNull': [f'${field}', 0]}, amount]}
+    
+    return [
+        {
+            '$set': {
+                'total_battles': add('total_battles', 1),
+                'battles_won': add('battles_won', 1 if won else 0),
+                'profit_battle_points': add('profit_battle_points', points if points_field == 'profit_battle_points' else 0),
+                'trade_war_points': add('trade_war_points', points if points_field == 'trade_war_points' else 0),
+                'updated_at': now
+            }
+        },
+        {'$set': {'total_points': _BATTLE_TOTAL_POINTS_EXPR}}
+    ]
+
+def _with_battle_win_rate(points: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive win_rate on read from the stored battle counters"""
+    total_battles = points.get('total_battles')
+    points['win_rate'] = (points.get('battles_won', 0) / total_battles) * 100 if total_battles else 0
+    return points
+
+def _token_group_stages(count_field: str) -> List[Dict[str, Any]]:
+    """Per-token profit, trade count (as count_field) and distinct trader count, without collecting trader sets"""
+    return [
+        {
+            '$group': {
+                '_id': {'ticker': '$ticker', 'trader': '$username_lc'},
+                'total_profit_usd': {'$sum': '$profit_usd'},
+                count_field: {'$sum': 1}
+            }
+        },
+        {
+            '$group': {
+                '_id': '$_id.ticker',
+                'total_profit_usd': {'$sum': '$total_profit_usd'},
+                count_field: {'$sum': f'${count_field}'},
+                'trader_count': {'$sum': 1}
+            }
+        }
+    ]
+
+# Average profit per trade, derived after the token boards are cut to size
+_TOKEN_AVG_PROFIT_STAGE = {
+    '$addFields': {'avg_profit': {'$divide': ['$total_profit_usd', '$total_trades']}}
+}
+
+def _db_safe(message: str, default: Any = None):
+    """Log and absorb database errors from a query method, returning a fresh copy of default instead"""
+    # Transient network errors never get here on the first attempt: the client retries reads and writes once.
+    # Only database errors are absorbed; bugs such as a KeyError propagate, as in the battle methods
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except PyMongoError as e:
+                logger.exception(f"{message}: {e}")
+                return copy.deepcopy(default)
+        return wrapper
+    return decorator
+
+def _started(cursor) -> Iterator[Dict[str, Any]]:
+    """Fetch a cursor's first batch now, so query errors surface here instead of on first iteration"""
+    first = next(cursor, None)
+    return iter(()) if first is None else itertools.chain((first,), cursor)
+
+def _map_batches(cursor, fn: Callable[[List[Dict[str, Any]]], Any], batch_size: int) -> List[Any]:
+    """Apply fn to each run of batch_size documents from cursor, holding only one run of documents at a time"""
+    results = []
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            results.append(fn(batch))
+            batch = []
+    if batch:
+        results.append(fn(batch))
+    return results
+
+def _rolling_start(days: int) -> datetime:
+    """Start of the rolling window covering the last N days"""
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
 class DatabaseManager:
+    """MongoDB access for the bot.
+
+    PNL writes are acknowledged by the primary only (w=1, j=False) and batched
+    through unordered insert_many calls: a crash can lose the last few trades,
+    which is acceptable for leaderboard stats in exchange for lower write latency.
+    """
+    
     def __init__(self, host: str = "localhost", port: int = 27017, database: str = "telegram"):
         """Initialize database connection"""
         self.host = host
@@ -26,18 +519,38 @@ class DatabaseManager:
         self.pnls_collection = None
         self.battles_collection = None
         self.battle_points_collection = None
+        self.rollups = None
+        self.global_stats = None
+        self.leaderboards = None
+        self._indexes_ensured = False
+        self._prepared = False
+        self._rollups_stale = False
+        self._cache = {}
+        self._refresh_timer = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_due = 0.0
+        self._refresh_running = False
+        self._refresh_requested = False
+        # Monotonic times of the last rollup write and the start of the last completed refresh
+        self._rollups_changed_at = 0.0
+        self._leaderboards_refreshed_at = 0.0
         
     def connect(self) -> bool:
-        """Establish connection to MongoDB"""
+        """Set up the client and collection handles; the driver connects lazily, so no ping is sent"""
         try:
-            self.client = MongoClient(self.host, self.port, serverSelectionTimeoutMS=5000)
-            # Test the connection
-            self.client.admin.command('ping')
+            self.client = _get_client(self.host, self.port)
             self.db = self.client[self.database_name]
-            self.pnls_collection = self.db['pnls']
+            self.pnls_collection = self.db.get_collection('pnls', write_concern=WriteConcern(w=1, j=False))
             self.battles_collection = self.db['battles']
             self.battle_points_collection = self.db['battle_points']
-            logger.info(f"Successfully connected to MongoDB at {self.host}:{self.port}")
+            self.rollups = self.db['pnl_rollups']
+            self.global_stats = self.db['global_stats']
+            self.leaderboards = self.db['leaderboards']
+            # Indexes, backfills and the first leaderboard refresh run on the timer thread,
+            # which keeps retrying until the server is reachable
+            with self._refresh_lock:
+                self._start_refresh_timer(0)
+            logger.info(f"Using MongoDB at {self.host}:{self.port}")
             return True
         except ConnectionFailure as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
@@ -46,34 +559,471 @@ class DatabaseManager:
             logger.error(f"Unexpected error connecting to MongoDB: {e}")
             return False
     
+    def health_check(self) -> bool:
+        """Ping the server; True when it answered"""
+        try:
+            self.client.admin.command('ping')
+            return True
+        except Exception as e:
+            logger.error(f"MongoDB health check failed: {e}")
+            return False
+    
+    def _prepare_collections(self):
+        """Create indexes and run the one-off backfills, once the server is reachable"""
+        if self._prepared:
+            # Indexes that failed, or were dropped under the running bot, are retried on each refresh
+            self._ensure_indexes()
+            return
+        if not self._ensure_indexes():
+            # Server not reachable yet; the next leaderboard refresh tries again
+            return
+        # The backfills do not depend on any one index, so they run even if some could not be created
+        marker = self.global_stats.find_one({'_id': 'backfills'}) or {}
+        backfilled = marker.get('version', 0) >= BACKFILL_VERSION
+        if not backfilled:
+            self._backfill_derived_fields()
+        self._ensure_rollups()
+        if not backfilled:
+            # Recorded after the rollups, since a rebuild replaces the whole global_stats collection
+            self.global_stats.update_one(
+                {'_id': 'backfills'}, {'$set': {'version': BACKFILL_VERSION}}, upsert=True
+            )
+        self._prepared = True
+    
+    def _index_models(self) -> List[Tuple[Any, List[IndexModel]]]:
+        """The indexes backing leaderboard and user queries, per collection"""
+        return [
+            # Equality fields first, then the timestamp sort/range field (ESR ordering)
+            (self.pnls_collection, [
+                IndexModel([('timestamp', -1)], background=True),
+                IndexModel([('username', 1), ('timestamp', -1)], background=True),
+                IndexModel([('ticker', 1), ('timestamp', -1)], background=True),
+                IndexModel([('profit_usd', -1)], background=True),
+                IndexModel([('initial_investment', 1)], background=True),
+                IndexModel([('percent_gain', -1)], background=True),
+                IndexModel([('timestamp', -1), ('percent_gain', -1)], background=True),
+                IndexModel([('username_lc', 1), ('timestamp', -1)], background=True),
+                IndexModel([('user_id', 1), ('timestamp', -1)], background=True),
+                IndexModel([('is_win', 1)], background=True),
+                IndexModel([('timestamp', 1), ('profit_usd', -1)], background=True),
+                # Covers the time trends scan, which only reads these three fields
+                IndexModel([('dow', 1), ('hour', 1), ('profit_usd', 1)], background=True),
+                # Losses only, covering the loss leaderboard's projection so it never fetches documents
+                IndexModel(
+                    [('profit_usd', 1), ('username', 1), ('ticker', 1), ('timestamp', 1)],
+                    name='profit_usd_losses',
+                    partialFilterExpression={'profit_usd': {'$lt': 0}},
+                    background=True
+                )
+            ]),
+            # Rollups are keyed by normalized username (_id), sorted by profit
+            (self.rollups, [
+                IndexModel([('total_profit_usd', -1)], background=True)
+            ]),
+            # $merge target key for the materialized leaderboards, also serving rank-ordered reads
+            (self.leaderboards, [
+                IndexModel([('category', 1), ('rank', 1)], unique=True, background=True)
+            ]),
+            # Battle lookups: points by user and by each leaderboard order, battles by
+            # participant history and by the expiry scan (status equality, end_date range)
+            (self.battle_points_collection, [
+                IndexModel([('username', 1)], unique=True, background=True),
+                IndexModel([('profit_battle_points', -1)], background=True),
+                IndexModel([('trade_war_points', -1)], background=True),
+                IndexModel([('total_points', -1)], background=True)
+            ]),
+            (self.battles_collection, [
+                IndexModel([('status', 1), ('end_date', 1)], background=True),
+                IndexModel([('participants', 1), ('created_at', -1)], background=True)
+            ])
+        ]
+    
+    def _ensure_indexes(self) -> bool:
+        """Create each index on its own, so one failure does not block the rest; False when the server is unreachable"""
+        if self._indexes_ensured:
+            return True
+        
+        all_created = True
+        for collection, models in self._index_models():
+            for model in models:
+                try:
+                    collection.create_indexes([model])
+                except ConnectionFailure as e:
+                    logger.warning(f"Could not reach MongoDB to create indexes: {e}")
+                    return False
+                except Exception as e:
+                    all_created = False
+                    logger.warning(f"Could not create index {model.document['name']} on {collection.name}: {e}")
+        self._indexes_ensured = all_created
+        return True
+    
+    def _backfill_username_lc(self) -> int:
+        """Set username_lc with normalize_username, as the insert path does; returns the number of records changed"""
+        modified = 0
+        operations = []
+        # Non-ASCII names may carry a key from the old server-side $toLower backfill
+        records = self.pnls_collection.find(
+            {'$or': [{'username_lc': {'$exists': False}}, {'username': {'$regex': '[^\\x00-\\x7f]'}}]},
+            {'username': 1, 'username_lc': 1}
+        )
+        for record in records:
+            username_lc = normalize_username(record.get('username'))
+            if record.get('username_lc') != username_lc:
+                operations.append(UpdateOne({'_id': record['_id']}, {'$set': {'username_lc': username_lc}}))
+            if len(operations) >= WRITE_BATCH_SIZE:
+                modified += self.pnls_collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            modified += self.pnls_collection.bulk_write(operations, ordered=False).modified_count
+        return modified
+    
+    def _backfill_derived_fields(self):
+        """Add stored derived fields to records written before those fields existed"""
+        try:
+            modified = self._backfill_username_lc()
+            if modified:
+                # Rollups are keyed by username_lc, so they have to be regrouped
+                self._rollups_stale = True
+                logger.info(f"Backfilled username_lc on {modified} PNL records")
+        except Exception as e:
+            logger.warning(f"Could not backfill username_lc on PNL records: {e}")
+        
+        for field, expression in _DERIVED_FIELD_EXPRS.items():
+            try:
+                result = self.pnls_collection.update_many(
+                    {field: {'$exists': False}, **_DERIVED_FIELD_FILTERS.get(field, {})},
+                    [{'$set': {field: expression}}]
+                )
+                if result.modified_count:
+                    logger.info(f"Backfilled {field} on {result.modified_count} PNL records")
+            except Exception as e:
+                logger.warning(f"Could not backfill {field} on PNL records: {e}")
+        
+        try:
+            # Older records stored numeric user_ids; lookups compare against the string form
+            result = self.pnls_collection.update_many(
+                {'user_id': {'$type': 'number'}},
+                [{'$set': {'user_id': {'$toString': '$user_id'}}}]
+            )
+            if result.modified_count:
+                logger.info(f"Converted user_id to string on {result.modified_count} PNL records")
+        except Exception as e:
+            logger.warning(f"Could not convert numeric user_ids on PNL records: {e}")
+        
+        try:
+            result = self.battle_points_collection.update_many(
+                {'total_points': {'$exists': False}},
+                [{'$set': {'total_points': _BATTLE_TOTAL_POINTS_EXPR}}]
+            )
+            if result.modified_count:
+                logger.info(f"Backfilled total_points on {result.modified_count} battle point records")
+        except Exception as e:
+            logger.warning(f"Could not backfill total_points on battle point records: {e}")
+        
+        try:
+            # Participants are stored without the @ so history lookups are a plain multikey equality
+            result = self.battles_collection.update_many(
+                {'participants': {'$regex': '^@'}},
+                [{
+                    '$set': {
+                        'participants': {
+                            '$map': {
+                                'input': '$participants',
+                                'in': {
+                                    '$cond': [
+                                        # Code-point substrings: byte offsets can split a multi-byte first character
+                                        {'$eq': [{'$substrCP': ['$$this', 0, 1]}, '@']},
+                                        {'$substrCP': ['$$this', 1, {'$strLenCP': '$$this'}]},
+                                        '$$this'
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                }]
+            )
+            if result.modified_count:
+                logger.info(f"Stripped @ from participants on {result.modified_count} battles")
+        except Exception as e:
+            logger.warning(f"Could not normalize battle participants: {e}")
+    
+    def _ensure_rollups(self):
+        """Seed the per-user rollup collection from existing trades if it is empty or out of date"""
+        try:
+            # Rebuild when the stored totals no longer match the raw trades, e.g. after a sync or import
+            totals = self.global_stats.find_one({'_id': 'global'}, {'total_trades': 1})
+            rollups_missing = (
+                self._rollups_stale or
+                totals is None or
+                totals.get('total_trades') != self.pnls_collection.count_documents({}) or
+                self.rollups.estimated_document_count() == 0 or
+                self.rollups.find_one({'losing_trades': {'$exists': False}}, {'_id': 1}) is not None
+            )
+            if rollups_missing and self.pnls_collection.estimated_document_count() > 0:
+                self.rebuild_rollups()
+            self._rollups_stale = False
+            
+            # Distinct counts come from the rollups and the ticker index, not from sets on the global document
+            self.global_stats.update_one(
+                {'_id': 'global', 'unique_traders': {'$exists': True}},
+                {'$unset': {'unique_traders': '', 'unique_tokens': ''}}
+            )
+        except Exception as e:
+            logger.warning(f"Could not seed PNL rollups: {e}")
+    
+    def rebuild_rollups(self):
+        """Recompute every per-user rollup document and the global stats from the raw PNL records"""
+        pipeline = [
+            {
+                '$group': {
+                    '_id': '$username_lc',
+                    'username': {'$first': '$username'},
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'total_profit_sol': {'$sum': '$profit_sol'},
+                    'trade_count': {'$sum': 1},
+                    'winning_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+                        }
+                    },
+                    'losing_trades': {
+                        '$sum': {
+                            '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
+                        }
+                    },
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'total_investment_usd': {'$sum': '$investment_usd'},
+                    'max_investment': {'$max': '$initial_investment'},
+                    'best_trade': {'$max': '$profit_usd'},
+                    'worst_trade': {'$min': '$profit_usd'},
+                    'unique_tokens': {'$addToSet': '$ticker'}
+                }
+            },
+            {'$out': 'pnl_rollups'}  # Atomically replaces the collection, keeping its indexes
+        ]
+        self.pnls_collection.aggregate(pipeline, **_BACKGROUND_AGG_OPTS)
+        
+        global_pipeline = [
+            {
+                '$group': {
+                    '_id': 'global',
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'total_profit_sol': {'$sum': '$profit_sol'},
+                    'total_trades': {'$sum': 1},
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'winning_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+                        }
+                    },
+                    'losing_trades': {
+                        '$sum': {
+                            '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
+                        }
+                    }
+                }
+            },
+            {'$out': 'global_stats'}
+        ]
+        self.pnls_collection.aggregate(global_pipeline, **_BACKGROUND_AGG_OPTS)
+        logger.info("Rebuilt PNL rollups")
+    
+    def _update_rollups(self, records: List[Dict[str, Any]]):
+        """Fold newly inserted PNL records into their owners' rollup documents and the global stats"""
+        operations = []
+        global_inc = {
+            'total_profit_usd': 0,
+            'total_profit_sol': 0,
+            'total_trades': 0,
+            'total_investment': 0,
+            'winning_trades': 0,
+            'losing_trades': 0
+        }
+        for record in records:
+            profit_usd = record.get('profit_usd', 0)
+            username = normalize_username(record.get('username'))
+            ticker = record.get('ticker', '')
+            operations.append(UpdateOne(
+                {'_id': username},
+                {
+                    '$inc': {
+                        'total_profit_usd': profit_usd,
+                        'total_profit_sol': record.get('profit_sol', 0),
+                        'trade_count': 1,
+                        'winning_trades': 1 if profit_usd > 0 else 0,
+                        'losing_trades': 1 if profit_usd < 0 else 0,
+                        'total_investment': record.get('initial_investment', 0),
+                        'total_investment_usd': record.get('investment_usd', 0)
+                    },
+                    '$max': {'best_trade': profit_usd, 'max_investment': record.get('initial_investment', 0)},
+                    '$min': {'worst_trade': profit_usd},
+                    '$addToSet': {'unique_tokens': ticker},
+                    '$setOnInsert': {'username': record.get('username')}
+                },
+                upsert=True
+            ))
+            
+            global_inc['total_profit_usd'] += profit_usd
+            global_inc['total_profit_sol'] += record.get('profit_sol', 0)
+            global_inc['total_trades'] += 1
+            global_inc['total_investment'] += record.get('initial_investment', 0)
+            global_inc['winning_trades'] += 1 if profit_usd > 0 else 0
+            global_inc['losing_trades'] += 1 if profit_usd < 0 else 0
+        
+        if operations:
+            self.rollups.bulk_write(operations, ordered=False)
+            self.global_stats.update_one({'_id': 'global'}, {'$inc': global_inc}, upsert=True)
+    
+    def refresh_leaderboards(self):
+        """Rebuild the materialized leaderboards from the per-user rollups"""
+        started = time.monotonic()
+        refreshed_at = datetime.now(timezone.utc)
+        for category, (stages, sort) in _MATERIALIZED_LEADERBOARDS.items():
+            pipeline = stages + [
+                {'$sort': sort},
+                {'$limit': MATERIALIZED_LEADERBOARD_SIZE},
+                {
+                    '$setWindowFields': {
+                        'sortBy': sort,
+                        'output': {'rank': {'$documentNumber': {}}}
+                    }
+                },
+                {'$addFields': {'user': '$_id', 'category': category, 'refreshed_at': refreshed_at}},
+                {'$project': {'_id': 0, 'unique_tokens': 0}},
+                {
+                    '$merge': {
+                        'into': 'leaderboards',
+                        'on': ['category', 'rank'],
+                        'whenMatched': 'replace',
+                        'whenNotMatched': 'insert'
+                    }
+                }
+            ]
+            self.rollups.aggregate(pipeline, **_BACKGROUND_AGG_OPTS)
+        # Ranks this refresh did not rewrite belong to users who no longer qualify
+        self.leaderboards.delete_many({'refreshed_at': {'$lt': refreshed_at}})
+        self._leaderboards_refreshed_at = started
+        # Cached boards may have been read from the rollups while these rows were stale
+        self._cache.clear()
+    
+    def _schedule_leaderboard_refresh(self):
+        """Prepare the collections if needed and refresh the materialized leaderboards, now and every LEADERBOARD_REFRESH_INTERVAL seconds"""
+        with self._refresh_lock:
+            self._refresh_running = True
+            self._refresh_requested = False
+        try:
+            self._prepare_collections()
+            if self._prepared:
+                self.refresh_leaderboards()
+        except Exception as e:
+            logger.warning(f"Could not refresh materialized leaderboards: {e}")
+        with self._refresh_lock:
+            self._refresh_running = False
+            if self.client is None:
+                return
+            # Writes made during this refresh may have missed it
+            self._start_refresh_timer(
+                LEADERBOARD_WRITE_REFRESH_DELAY if self._refresh_requested else LEADERBOARD_REFRESH_INTERVAL
+            )
+    
+    def _start_refresh_timer(self, delay: float):
+        """Run _schedule_leaderboard_refresh on a daemon timer thread after delay seconds, replacing any pending run; hold _refresh_lock"""
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        self._refresh_due = time.monotonic() + delay
+        self._refresh_timer = threading.Timer(delay, self._schedule_leaderboard_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+    
+    def _request_leaderboard_refresh(self):
+        """Bring the next leaderboard refresh forward after a write; it is never pushed back, so steady writes cannot starve it"""
+        with self._refresh_lock:
+            self._refresh_requested = True
+            if self.client is None or self._refresh_running:
+                return
+            if self._refresh_due - time.monotonic() > LEADERBOARD_WRITE_REFRESH_DELAY:
+                self._start_refresh_timer(LEADERBOARD_WRITE_REFRESH_DELAY)
+    
+    def _leaderboards_current(self) -> bool:
+        """Whether the materialized leaderboards include every rollup write made by this process"""
+        return self._leaderboards_refreshed_at >= self._rollups_changed_at
+    
+    def _materialized_leaderboard(self, category: str, limit: int) -> List[Dict[str, Any]]:
+        """Read the top ranks of a materialized leaderboard, ranking the rollups directly when not populated or behind"""
+        # Only this process's writes are tracked; trades written elsewhere appear after the next refresh
+        if limit <= MATERIALIZED_LEADERBOARD_SIZE and self._leaderboards_current():
+            rows = list(self.leaderboards.find(
+                {'category': category},
+                {'_id': 0, 'category': 0, 'refreshed_at': 0}
+            ).sort('rank', 1).limit(limit))
+            if rows:
+                for row in rows:
+                    row['_id'] = row.pop('user')
+                return rows
+        return self._rollup_leaderboard(category, limit)
+    
+    def _rollup_leaderboard(self, category: str, limit: int) -> List[Dict[str, Any]]:
+        """Rank the per-user rollups for a leaderboard category (one document per user, not per trade)"""
+        stages, sort = _MATERIALIZED_LEADERBOARDS[category]
+        pipeline = stages + [
+            {'$sort': sort},
+            {'$limit': limit},
+            {'$project': {'unique_tokens': 0}}
+        ]
+        return list(self.rollups.aggregate(pipeline, batchSize=limit, **_AGG_OPTS))
+    
+    @staticmethod
+    def _apply_rollup_ratios(rollup: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the win_rate/roi fields the leaderboard pipelines compute server-side"""
+        trade_count = rollup.get('trade_count', 0)
+        total_investment = rollup.get('total_investment', 0)
+        rollup['win_rate'] = (rollup.get('winning_trades', 0) / trade_count) * 100 if trade_count > 0 else 0
+        rollup['roi'] = (rollup.get('total_profit_usd', 0) / total_investment) * 100 if total_investment > 0 else 0
+        return rollup
+    
+    @staticmethod
+    def _user_stats_from_rollup(rollup: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a rollup document like the user stats pipeline output"""
+        total_trades = rollup.get('trade_count', 0)
+        total_profit_usd = rollup.get('total_profit_usd', 0)
+        total_investment_usd = rollup.get('total_investment_usd', 0)
+        unique_tokens = rollup.get('unique_tokens', [])
+        return {
+            'total_trades': total_trades,
+            'total_profit_usd': total_profit_usd,
+            'total_profit_sol': rollup.get('total_profit_sol', 0),
+            'total_investment_usd': total_investment_usd,
+            'winning_trades': rollup.get('winning_trades', 0),
+            'losing_trades': rollup.get('losing_trades', 0),
+            'best_trade': rollup.get('best_trade'),
+            'worst_trade': rollup.get('worst_trade'),
+            'avg_profit': total_profit_usd / total_trades if total_trades > 0 else 0,
+            'unique_tokens': unique_tokens,
+            'win_rate': (rollup.get('winning_trades', 0) / total_trades) * 100 if total_trades > 0 else 0,
+            'roi': (total_profit_usd / total_investment_usd) * 100 if total_investment_usd > 0 else 0,
+            'token_count': len(unique_tokens)
+        }
+    
     def create_username_match_conditions(self, user_id=None, username=None):
-        """Create comprehensive username matching conditions for database queries"""
+        """Create username matching conditions, each an indexed equality (user_id or username_lc)"""
         conditions = []
         
-        # Add user_id matches if provided
+        # user_id is stored as a string, so one equality covers it
         if user_id:
-            conditions.extend([
-                {'user_id': str(user_id)},
-                {'user_id': user_id}  # Handle both string and int user_id
-            ])
+            conditions.append({'user_id': str(user_id)})
         
-        # Add username matches if provided
+        # The stored username_lc replaces matching @/case variants of the raw username
         if username:
-            # Clean username (remove @ if present)
-            clean_username = username.replace('@', '') if username.startswith('@') else username
-            
-            # Add all possible username variations
-            conditions.extend([
-                {'username': username},                    # Exact match
-                {'username': f'@{clean_username}'},        # With @ prefix
-                {'username': clean_username},              # Without @ prefix
-                {'username': {'$regex': f'^@?{re.escape(clean_username)}$', '$options': 'i'}}  # Case insensitive regex
-            ])
+            conditions.append({'username_lc': normalize_username(username)})
         
         return conditions
     
     def create_username_match_query(self, user_id=None, username=None):
         """Create a MongoDB query for username matching"""
+        return self.create_indexed_user_query(user_id, username)
+    
+    def create_indexed_user_query(self, user_id=None, username=None):
+        """Create a user query whose every branch is an indexed equality (user_id or username_lc)"""
         conditions = self.create_username_match_conditions(user_id, username)
         
         if not conditions:
@@ -82,1514 +1032,1084 @@ class DatabaseManager:
         if len(conditions) == 1:
             return conditions[0]
         
+        # Historical imports carry synthetic user_ids, so the username branch is still needed
         return {'$or': conditions}
     
+    @staticmethod
+    def _add_derived_fields(record: Dict[str, Any]):
+        """Store fields that queries would otherwise compute per document"""
+        initial_investment = record.get('initial_investment') or 0
+        record['percent_gain'] = (
+            (record.get('profit_usd', 0) / initial_investment) * 100 if initial_investment > 0 else None
+        )
+        record['username_lc'] = normalize_username(record.get('username'))
+        if record.get('user_id') is not None:
+            record['user_id'] = str(record['user_id'])
+        record['is_win'] = record.get('profit_usd', 0) > 0
+        timestamp = record.get('timestamp')
+        if isinstance(timestamp, datetime):
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc)
+            # Same numbering as $dayOfWeek: Sunday is 1, Saturday is 7
+            record['dow'] = timestamp.isoweekday() % 7 + 1
+            record['hour'] = timestamp.hour
+    
     def insert_pnl_record(self, record: Dict[str, Any]) -> bool:
-        """Insert a PNL record into the database"""
-        try:
-            # Add timestamp if not present
+        """Insert a PNL record into the database; True once it is stored"""
+        return self.insert_pnl_records([record]) == 1
+    
+    @_db_safe("Error inserting PNL records", 0)
+    def insert_pnl_records(self, records: List[Dict[str, Any]]) -> int:
+        """Insert many PNL records at once; returns the number written"""
+        for record in records:
             if 'timestamp' not in record:
                 record['timestamp'] = datetime.now(timezone.utc)
-            
-            result = self.pnls_collection.insert_one(record)
-            logger.info(f"Inserted PNL record with ID: {result.inserted_id}")
-            return True
+            self._add_derived_fields(record)
+        return self._write_batch(records)
+    
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """Write PNL records with one unordered insert_many and fold them into the rollups; returns the number written"""
+        if not batch:
+            return 0
+        
+        inserted = batch
+        try:
+            self.pnls_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate _id means an earlier, interrupted attempt already stored the record
+            failed = {
+                error['index'] for error in e.details.get('writeErrors', [])
+                if error.get('code') != _DUPLICATE_KEY_ERROR
+            }
+            inserted = [record for i, record in enumerate(batch) if i not in failed]
+            if failed:
+                logger.error(f"Failed to insert {len(failed)} of {len(batch)} PNL records: {e}")
         except Exception as e:
-            logger.error(f"Error inserting PNL record: {e}")
-            return False
+            # Nothing came back from the server; the caller reports the failure
+            logger.error(f"Error inserting PNL records: {e}")
+            return 0
+        
+        try:
+            self._update_rollups(inserted)
+        except Exception as e:
+            logger.error(f"Error updating PNL rollups: {e}")
+        # Until the next refresh the leaderboards are ranked from the rollups directly
+        self._rollups_changed_at = time.monotonic()
+        self._request_leaderboard_refresh()
+        
+        # Every cached leaderboard and total may include the new trades
+        self._cache.clear()
+        
+        logger.debug("Inserted %d PNL records", len(inserted))
+        return len(inserted)
+    
+    def _leaderboard_pipeline(self, match: Dict[str, Any], sort_field: str, limit: int) -> List[Dict[str, Any]]:
+        """Build a per-user leaderboard pipeline from the shared stage templates"""
+        pipeline = [{'$match': match}] if match else []
+        pipeline.extend([
+            _LEADERBOARD_GROUP_STAGE,
+            {'$sort': {sort_field: -1}},
+            {'$limit': limit},
+            # Ratios only for the users that made the board; sort fields are group totals
+            _LEADERBOARD_DERIVED_STAGE
+        ])
+        return pipeline
+    
+    def _hinted(self, run: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call run(*args, **kwargs); if its hinted index is missing, run it unhinted and have the indexes re-created"""
+        try:
+            return run(*args, **kwargs)
+        except OperationFailure as e:
+            if 'hint' not in kwargs or 'hint' not in str(e).lower():
+                raise
+            hint = kwargs.pop('hint')
+            logger.warning(f"Index {hint} is missing, running without the hint: {e}")
+            # The next leaderboard refresh creates it again (e.g. after a sync dropped the collection)
+            self._indexes_ensured = False
+            return run(*args, **kwargs)
+    
+    def _cached(self, key: tuple, ttl: float, fn: Callable[[], Any]) -> Any:
+        """Return fn(), reusing its result for ttl seconds; results of raising calls are not kept"""
+        # Callers get their own copy, so reformatting a result cannot change the cached entry
+        cached = self._cache.get(key)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            return copy.deepcopy(cached[1])
+        
+        value = fn()
+        if len(self._cache) >= CACHE_MAX_ENTRIES:
+            self._cache.clear()
+        self._cache[key] = (now + ttl, value)
+        return copy.deepcopy(value)
+    
+    def _drop_cached(self, name: str):
+        """Forget every cached result whose key starts with name"""
+        for key in [key for key in list(self._cache) if key[0] == name]:
+            self._cache.pop(key, None)
     
+    def _get_leaderboard(self, sort_field: str, limit: int,
+                         start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Run a leaderboard pipeline, serving repeated identical requests from the cache"""
+        match = {}
+        if start_date or end_date:
+            match['timestamp'] = {}
+            if start_date:
+                match['timestamp']['$gte'] = start_date
+            if end_date:
+                match['timestamp']['$lt'] = end_date
+        
+        pipeline = self._leaderboard_pipeline(match, sort_field, limit)
+        options = dict(_AGG_OPTS, batchSize=limit)
+        if match:
+            options['hint'] = [('timestamp', -1)]
+        
+        cache_key = (
+            'leaderboard',
+            sort_field,
+            limit,
+            start_date.timestamp() if start_date else None,
+            end_date.timestamp() if end_date else None
+        )
+        return self._cached(
+            cache_key,
+            LEADERBOARD_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, **options))
+        )
+    
+    @_db_safe("Error getting all-time leaderboard", [])
     def get_all_time_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get all-time leaderboard with enhanced username matching to prevent fragmentation"""
-        try:
-            pipeline = [
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_investment': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$trade_count']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$cond': [
-                                {'$gt': ['$total_investment', 0]},
-                                {
-                                    '$multiply': [
-                                        {'$divide': ['$total_profit_usd', '$total_investment']},
-                                        100
-                                    ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
+        return self._cached(
+            ('all_time', limit),
+            ROLLUP_CACHE_TTL,
+            lambda: [
+                self._apply_rollup_ratios(leader)
+                for leader in self.rollups.find({}, {'unique_tokens': 0}).sort('total_profit_usd', -1).limit(limit)
             ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting all-time leaderboard: {e}")
-            return []
+        )
     
+    @_db_safe("Error getting monthly leaderboard", [])
     def get_monthly_leaderboard(self, year: int, month: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Get monthly leaderboard for specified year and month with enhanced username matching"""
-        try:
-            # Create date range for the month
-            start_date = datetime(year, month, 1, tzinfo=timezone.utc)
-            if month == 12:
-                end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-            else:
-                end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': start_date, '$lt': end_date}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_investment': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$trade_count']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$cond': [
-                                {'$gt': ['$total_investment', 0]},
-                                {
-                                    '$multiply': [
-                                        {'$divide': ['$total_profit_usd', '$total_investment']},
-                                        100
-                                    ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting monthly leaderboard: {e}")
-            return []
+        start_date, end_date = _month_bounds(year, month)
+        return self._get_leaderboard('total_profit_usd', limit, start_date, end_date)
     
+    @_db_safe("Error getting weekly leaderboard", [])
     def get_weekly_leaderboard(self, start_date: datetime, end_date: datetime, limit: int = 10) -> List[Dict[str, Any]]:
         """Get weekly leaderboard for specified date range with enhanced username matching"""
-        try:
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': start_date, '$lt': end_date}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_investment': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$trade_count']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$cond': [
-                                {'$gt': ['$total_investment', 0]},
-                                {
-                                    '$multiply': [
-                                        {'$divide': ['$total_profit_usd', '$total_investment']},
-                                        100
-                                    ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting weekly leaderboard: {e}")
-            return []
+        return self._get_leaderboard('total_profit_usd', limit, start_date, end_date)
     
+    @_db_safe("Error getting daily leaderboard", [])
     def get_daily_leaderboard(self, date: datetime, limit: int = 10) -> List[Dict[str, Any]]:
         """Get daily leaderboard for specified date with enhanced username matching"""
-        try:
-            start_date = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = start_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': start_date, '$lte': end_date}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_investment': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$trade_count']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$cond': [
-                                {'$gt': ['$total_investment', 0]},
-                                {
-                                    '$multiply': [
-                                        {'$divide': ['$total_profit_usd', '$total_investment']},
-                                        100
-                                    ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting daily leaderboard: {e}")
-            return []
+        start_date, end_date = _day_bounds(date.toordinal())
+        return self._get_leaderboard('total_profit_usd', limit, start_date, end_date)
+    
+    @_db_safe("Error getting period leaderboards", {'daily': [], 'weekly': [], 'monthly': [], 'all_time': []})
+    def get_period_leaderboards(self, now: Optional[datetime] = None, limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the daily, weekly (Monday to Sunday) and monthly profit boards from one scan, plus the all-time board"""
+        now = now or datetime.now(timezone.utc)
+        day_start, day_end = _day_bounds(now.toordinal())
+        week_start = day_start - timedelta(days=now.weekday())
+        week_end = week_start + timedelta(days=7)
+        month_start, month_end = _month_bounds(now.year, now.month)
+        
+        def window(start: datetime, end: datetime) -> List[Dict[str, Any]]:
+            return self._leaderboard_pipeline({'timestamp': {'$gte': start, '$lt': end}}, 'total_profit_usd', limit)
+        
+        # One timestamp range covering every window feeds all three boards
+        pipeline = [
+            {
+                '$match': {
+                    'timestamp': {'$gte': min(week_start, month_start), '$lt': max(week_end, month_end)}
+                }
+            },
+            {
+                '$facet': {
+                    'daily': window(day_start, day_end),
+                    'weekly': window(week_start, week_end),
+                    'monthly': window(month_start, month_end)
+                }
+            }
+        ]
+        result = self._cached(
+            ('period_leaderboards', day_start.timestamp(), limit),
+            LEADERBOARD_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, hint=[('timestamp', -1)], **_AGG_OPTS))
+        )
+        boards = dict(result[0]) if result else {'daily': [], 'weekly': [], 'monthly': []}
+        # The all-time board is already a bounded read of the rollups
+        boards['all_time'] = self.get_all_time_leaderboard(limit)
+        return boards
     
+    @_db_safe("Error getting trade count leaderboard", [])
     def get_trade_count_leaderboard(self, start_date: datetime, end_date: datetime, limit: int = 10) -> List[Dict[str, Any]]:
         """Get leaderboard by trade count for specified date range with enhanced username matching"""
-        try:
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': start_date, '$lt': end_date}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'trade_count': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'avg_profit_per_trade': {'$avg': '$profit_usd'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$trade_count']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$cond': [
-                                {'$gt': ['$total_investment', 0]},
-                                {
-                                    '$multiply': [
-                                        {'$divide': ['$total_profit_usd', '$total_investment']},
-                                        100
-                                    ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'trade_count': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting trade count leaderboard: {e}")
-            return []
+        return self._get_leaderboard('trade_count', limit, start_date, end_date)
     
+    @_db_safe("Error getting profit goat")
     def get_profit_goat(self) -> Optional[Dict[str, Any]]:
         """Get the user with highest all-time profit"""
-        try:
-            pipeline = [
-                {
-                    '$group': {
-                        '_id': '$username',  # Group by username instead of user_id
-                        'username': {'$first': '$username'},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1}
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': 1}
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting profit goat: {e}")
-            return None
+        goat = self._cached(('profit_goat',), ROLLUP_CACHE_TTL, lambda: self.rollups.find_one(
+            {},
+            {
+                'username': 1,
+                'total_profit_usd': 1,
+                'total_profit_sol': 1,
+                'trade_count': 1,
+                'winning_trades': 1,
+                'total_investment': 1
+            },
+            sort=[('total_profit_usd', -1)]
+        ))
+        return self._apply_rollup_ratios(goat) if goat else None
+    
+    def iter_all_pnl_data(self, fields: Optional[List[str]] = None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Stream all PNL data for reporting (only the given fields, if any), buffering at most batch_size records at a time"""
+        projection = {'_id': 0, **{field: 1 for field in fields}} if fields else {'_id': 0}
+        return self.pnls_collection.find({}, projection, batch_size=batch_size)
     
+    @_db_safe("Error getting all PNL data")
+    def map_all_pnl_batches(self, fn: Callable[[List[Dict[str, Any]]], Any], fields: Optional[List[str]] = None,
+                            batch_size: int = 500) -> Optional[List[Any]]:
+        """Apply fn (e.g. pd.DataFrame) to all PNL data, batch_size records at a time; None if the read failed"""
+        return _map_batches(self.iter_all_pnl_data(fields, batch_size), fn, batch_size)
+    
+    @_db_safe("Error getting all PNL data", [])
     def get_all_pnl_data(self) -> List[Dict[str, Any]]:
-        """Get all PNL data for reporting"""
-        try:
-            return list(self.pnls_collection.find({}, {'_id': 0}))
-        except Exception as e:
-            logger.error(f"Error getting all PNL data: {e}")
-            return []
+        """Get all PNL data for reporting (loads every record; prefer map_all_pnl_batches)"""
+        logger.warning("get_all_pnl_data loads the whole collection into memory; use map_all_pnl_batches")
+        return list(self.iter_all_pnl_data())
     
+    def _query_global_totals(self) -> Optional[Dict[str, Any]]:
+        """Read the global stats and count traders (one rollup each) and tokens (distinct over the ticker index)"""
+        totals = self.global_stats.find_one({'_id': 'global'})
+        if totals:
+            totals['trader_count'] = self.rollups.estimated_document_count()
+            totals['token_count'] = len(self.pnls_collection.distinct('ticker'))
+        return totals
+    
+    @_db_safe("Error getting total combined profit")
     def get_total_profit_combined(self) -> Optional[Dict[str, Any]]:
-        """Get the total combined profit across all trades"""
-        try:
-            pipeline = [
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'total_trades': {'$sum': 1},
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'unique_traders': {'$addToSet': '$username'},
-                        'unique_tokens': {'$addToSet': '$ticker'},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'losing_trades': {
-                            '$sum': {
-                                '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$addFields': {
-                        'trader_count': {'$size': '$unique_traders'},
-                        'token_count': {'$size': '$unique_tokens'},
-                        'overall_roi': {
-                            '$multiply': [
-                                {'$divide': ['$total_profit_usd', '$total_investment']},
-                                100
-                            ]
-                        },
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$total_trades']},
-                                100
-                            ]
-                        }
-                    }
-                }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting total combined profit: {e}")
+        """Get the total combined profit across all trades from the maintained global stats"""
+        totals = self._cached(('total_profit_combined',), ROLLUP_CACHE_TTL, self._query_global_totals)
+        if not totals:
             return None
+        
+        totals['overall_roi'] = (
+            (totals['total_profit_usd'] / totals['total_investment']) * 100
+            if totals.get('total_investment', 0) > 0 else 0
+        )
+        totals['win_rate'] = (
+            (totals['winning_trades'] / totals['total_trades']) * 100
+            if totals.get('total_trades', 0) > 0 else 0
+        )
+        return totals
 
     # ===== NEW METHODS FOR ENHANCED FEATURES =====
     
+    def _query_user_stats(self, match: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run the shared user stats pipeline; win_rate, roi and token_count come back computed"""
+        pipeline = [
+            {'$match': match},
+            _USER_STATS_GROUP_STAGE,
+            _USER_STATS_DERIVED_STAGE
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        return result[0] if result else None
+    
+    @_db_safe("Error getting user stats")
     def get_user_stats(self, user_id: str, username: str) -> Optional[Dict[str, Any]]:
         """Get comprehensive user statistics with improved user matching"""
-        try:
-            # Enhanced user matching - handle different username formats and ensure proper matching
-            user_match_conditions = self.create_username_match_conditions(user_id, username)
-            
-            if not user_match_conditions:
-                return None
-                
-            pipeline = [
-                {
-                    '$match': {
-                        '$or': user_match_conditions
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'total_investment_usd': {'$sum': '$investment_usd'},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'losing_trades': {
-                            '$sum': {
-                                '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'best_trade': {'$max': '$profit_usd'},
-                        'worst_trade': {'$min': '$profit_usd'},
-                        'avg_profit': {'$avg': '$profit_usd'},
-                        'unique_tokens': {'$addToSet': '$ticker'}
-                    }
-                }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            if result:
-                stats = result[0]
-                # Calculate win rate
-                stats['win_rate'] = (stats['winning_trades'] / stats['total_trades']) * 100 if stats['total_trades'] > 0 else 0
-                # Calculate ROI with better validation using USD investment amounts
-                if stats['total_investment_usd'] > 0:
-                    stats['roi'] = (stats['total_profit_usd'] / stats['total_investment_usd']) * 100
-                else:
-                    stats['roi'] = 0
-                stats['token_count'] = len(stats['unique_tokens'])
-                
-                # Debug logging to help identify issues
-                logger.info(f"User stats for {username} (ID: {user_id}): {stats['total_trades']} trades, ${stats['total_profit_usd']:.2f} profit, {stats['roi']:.2f}% ROI")
-                
-                return stats
-            return None
-        except Exception as e:
-            logger.error(f"Error getting user stats: {e}")
+        user_query = self.create_indexed_user_query(user_id, username)
+        
+        if not user_query:
             return None
+        
+        stats = self._query_user_stats(user_query)
+        if stats and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "User stats for %s (ID: %s): %d trades, $%.2f profit, %.2f%% ROI",
+                username, user_id, stats['total_trades'], stats['total_profit_usd'], stats['roi']
+            )
+        return stats
     
+    @_db_safe("Error getting user stats by username")
     def get_user_stats_by_username(self, username: str) -> Optional[Dict[str, Any]]:
-        """Get user stats by username only"""
-        try:
-            match_query = self.create_username_match_query(username=username)
-            pipeline = [
-                {
-                    '$match': match_query
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'total_investment_usd': {'$sum': '$investment_usd'},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'losing_trades': {
-                            '$sum': {
-                                '$cond': [{'$lt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'best_trade': {'$max': '$profit_usd'},
-                        'worst_trade': {'$min': '$profit_usd'},
-                        'avg_profit': {'$avg': '$profit_usd'},
-                        'unique_tokens': {'$addToSet': '$ticker'}
-                    }
-                }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            if result:
-                stats = result[0]
-                stats['win_rate'] = (stats['winning_trades'] / stats['total_trades']) * 100 if stats['total_trades'] > 0 else 0
-                stats['roi'] = (stats['total_profit_usd'] / stats['total_investment_usd']) * 100 if stats['total_investment_usd'] > 0 else 0
-                stats['token_count'] = len(stats['unique_tokens'])
-                return stats
-            return None
-        except Exception as e:
-            logger.error(f"Error getting user stats by username: {e}")
+        """Get user stats by username only, read from the user's maintained rollup document"""
+        if not username:
             return None
+        rollup = self.rollups.find_one({'_id': normalize_username(username)})
+        return self._user_stats_from_rollup(rollup) if rollup else None
     
+    @_db_safe("Error getting user history", [])
     def get_user_history(self, user_id: str, username: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Get user's trading history"""
-        try:
-            match_query = self.create_username_match_query(user_id, username)
-            return list(self.pnls_collection.find(
-                match_query,
-                {'_id': 0}
-            ).sort('timestamp', -1).limit(limit))
-        except Exception as e:
-            logger.error(f"Error getting user history: {e}")
+        user_query = self.create_indexed_user_query(user_id, username)
+        if not user_query:
             return []
+        return list(self.pnls_collection.find(
+            user_query,
+            _HISTORY_PROJECTION
+        ).sort('timestamp', -1).limit(limit))
     
+    @_db_safe("Error getting ROI leaderboard", [])
     def get_roi_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get ROI-based leaderboard with enhanced username matching"""
-        try:
-            pipeline = [
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'trade_count': {'$sum': 1}
-                    }
-                },
-                {
-                    '$match': {
-                        'total_investment': {'$gt': 0}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'roi_percentage': {
-                            '$multiply': [
-                                {'$divide': ['$total_profit_usd', '$total_investment']},
-                                100
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'roi_percentage': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting ROI leaderboard: {e}")
-            return []
+        return self._cached(('roi', limit), STATS_CACHE_TTL, lambda: self._materialized_leaderboard('roi', limit))
     
-    def get_token_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get most profitable tokens"""
-        try:
-            pipeline = [
-                {
-                    '$group': {
-                        '_id': '$ticker',
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_trades': {'$sum': 1},
-                        'avg_profit': {'$avg': '$profit_usd'},
-                        'unique_traders': {'$addToSet': '$username'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'trader_count': {'$size': '$unique_traders'}
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting token leaderboard: {e}")
-            return []
+    @_db_safe("Error getting token leaderboard", [])
+    def get_token_leaderboard(self, limit: int = 10, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Get most profitable tokens
+        
+        Pass since to rank only trades from that time on; the timestamp index then
+        narrows the $group input instead of scanning every trade.
+        """
+        pipeline = []
+        options = dict(_AGG_OPTS, batchSize=limit)
+        if since:
+            pipeline.append({'$match': {'timestamp': {'$gte': since}}})
+            options['hint'] = [('timestamp', -1)]
+        pipeline.extend(_token_group_stages('total_trades'))
+        pipeline.extend([
+            {'$sort': {'total_profit_usd': -1}},
+            {'$limit': limit},
+            _TOKEN_AVG_PROFIT_STAGE
+        ])
+        return self._cached(
+            ('tokens', limit, since.timestamp() if since else None),
+            STATS_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, **options))
+        )
     
+    @_db_safe("Error getting token stats")
     def get_token_stats(self, ticker: str) -> Optional[Dict[str, Any]]:
         """Get detailed stats for a specific token"""
-        try:
-            pipeline = [
-                {
-                    '$match': {
-                        'ticker': ticker.upper()
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'avg_profit': {'$avg': '$profit_usd'},
-                        'best_trade': {'$max': '$profit_usd'},
-                        'worst_trade': {'$min': '$profit_usd'},
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'successful_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'unique_traders': {'$addToSet': '$username'}
+        pipeline = [
+            {
+                '$match': {
+                    'ticker': ticker.upper()
+                }
+            },
+            # Group per trader first so the trader count is a $sum, not a set held in memory
+            {
+                '$group': {
+                    '_id': '$username_lc',
+                    'total_trades': {'$sum': 1},
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'best_trade': {'$max': '$profit_usd'},
+                    'worst_trade': {'$min': '$profit_usd'},
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'successful_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+                        }
                     }
-                },
-                {
-                    '$addFields': {
-                        'success_rate': {
-                            '$multiply': [
-                                {'$divide': ['$successful_trades', '$total_trades']},
-                                100
-                            ]
-                        },
-                        'trader_count': {'$size': '$unique_traders'}
+                }
+            },
+            {
+                '$group': {
+                    '_id': None,
+                    'total_trades': {'$sum': '$total_trades'},
+                    'total_profit_usd': {'$sum': '$total_profit_usd'},
+                    'best_trade': {'$max': '$best_trade'},
+                    'worst_trade': {'$min': '$worst_trade'},
+                    'total_investment': {'$sum': '$total_investment'},
+                    'successful_trades': {'$sum': '$successful_trades'},
+                    'trader_count': {'$sum': 1}
+                }
+            },
+            {
+                '$addFields': {
+                    'avg_profit': {'$divide': ['$total_profit_usd', '$total_trades']},
+                    'success_rate': {
+                        '$multiply': [
+                            {'$divide': ['$successful_trades', '$total_trades']},
+                            100
+                        ]
                     }
                 }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting token stats: {e}")
-            return None
+            }
+        ]
+        result = self._cached(
+            ('token_stats', ticker.upper()),
+            STATS_CACHE_TTL,
+            lambda: list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        )
+        return result[0] if result else None
     
+    @_db_safe("Error getting trending tokens", [])
     def get_trending_tokens(self, days: int = 7, limit: int = 10) -> List[Dict[str, Any]]:
         """Get most traded tokens in recent days"""
-        try:
-            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days)
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': cutoff_date}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$ticker',
-                        'trade_count': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'unique_traders': {'$addToSet': '$username'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'trader_count': {'$size': '$unique_traders'}
-                    }
-                },
-                {'$sort': {'trade_count': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting trending tokens: {e}")
-            return []
+        cutoff_date = _rolling_start(days)
+        
+        pipeline = [
+            {
+                '$match': {
+                    'timestamp': {'$gte': cutoff_date}
+                }
+            },
+            *_token_group_stages('trade_count'),
+            {'$sort': {'trade_count': -1}},
+            {'$limit': limit}
+        ]
+        return self._cached(
+            ('trending', days, limit),
+            STATS_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, batchSize=limit, hint=[('timestamp', -1)], **_AGG_OPTS))
+        )
     
-    def get_whale_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get highest investment amounts leaderboard with enhanced username matching"""
-        try:
-            pipeline = [
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
-                            }
-                        }
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'max_investment': {'$max': '$initial_investment'},
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'trade_count': {'$sum': 1}
-                    }
-                },
-                {'$sort': {'max_investment': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting whale leaderboard: {e}")
-            return []
+    @_db_safe("Error getting whale leaderboard", [])
+    def get_whale_leaderboard(self, limit: int = 10, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Get highest investment amounts leaderboard with enhanced username matching
+        
+        The all-time board is read from the per-user rollups. Pass since to
+        rank recent trades instead: only trades with a recorded investment in
+        the window are grouped, filtered via the timestamp index.
+        """
+        if not since:
+            return self._cached(('whales', limit), STATS_CACHE_TTL, lambda: self._materialized_leaderboard('whales', limit))
+        
+        match = {'initial_investment': {'$gt': 0}, 'timestamp': {'$gte': since}}
+        pipeline = [
+            {'$match': match},
+            {
+                '$group': {
+                    '_id': '$username_lc',
+                    'username': {'$first': '$username'},  # Keep original username for display
+                    'max_investment': {'$max': '$initial_investment'},
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'trade_count': {'$sum': 1}
+                }
+            },
+            {'$sort': {'max_investment': -1}},
+            {'$limit': limit}
+        ]
+        return self._cached(
+            ('whales', limit, since.timestamp()),
+            STATS_CACHE_TTL,
+            # Keep the planner on the window rather than the much wider initial_investment index
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, batchSize=limit, hint=[('timestamp', -1)], **_AGG_OPTS))
+        )
     
-    def get_percent_gain_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get best percentage gains leaderboard with enhanced username matching"""
-        try:
-            pipeline = [
-                {
-                    '$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},  # Remove @ symbol
-                                    '$username'  # Keep as is
-                                ]
+    @_db_safe("Error getting dashboard", {})
+    def get_dashboard(self, limit: int = 10, trending_days: int = 7,
+                      since: Optional[datetime] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the profit, ROI, whale, token and trending boards from one collection scan
+        
+        Pass since to build every board from recent trades only (e.g. the last 90
+        days); the scan then becomes a timestamp index range instead of the whole
+        collection.
+        """
+        trending_cutoff = _rolling_start(trending_days)
+        
+        pipeline = [{'$match': {'timestamp': {'$gte': since}}}] if since else []
+        pipeline += [
+            {
+                '$facet': {
+                    'all_time': [
+                        _LEADERBOARD_GROUP_STAGE,
+                        {'$sort': {'total_profit_usd': -1}},
+                        {'$limit': limit},
+                        _LEADERBOARD_DERIVED_STAGE
+                    ],
+                    'roi': [
+                        {
+                            '$group': {
+                                '_id': '$username_lc',
+                                'username': {'$first': '$username'},
+                                'total_profit_usd': {'$sum': '$profit_usd'},
+                                'total_investment': {'$sum': '$initial_investment'},
+                                'trade_count': {'$sum': 1}
                             }
                         },
-                        'percent_gain': {
-                            '$cond': [
-                                {'$gt': ['$initial_investment', 0]},
-                                {
+                        {'$match': {'total_investment': {'$gt': 0}}},
+                        {
+                            '$addFields': {
+                                'roi_percentage': {
                                     '$multiply': [
-                                        {'$divide': ['$profit_usd', '$initial_investment']},
+                                        {'$divide': ['$total_profit_usd', '$total_investment']},
                                         100
                                     ]
-                                },
-                                0
-                            ]
-                        }
-                    }
-                },
-                {
-                    '$match': {
-                        'initial_investment': {'$gt': 0},
-                        'profit_usd': {'$gt': 0}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},  # Keep original username for display
-                        'best_percent_gain': {'$max': '$percent_gain'},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'trade_count': {'$sum': 1}
-                    }
-                },
-                {'$sort': {'best_percent_gain': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting percent gain leaderboard: {e}")
-            return []
+                                }
+                            }
+                        },
+                        {'$sort': {'roi_percentage': -1}},
+                        {'$limit': limit}
+                    ],
+                    'whales': [
+                        {
+                            '$group': {
+                                '_id': '$username_lc',
+                                'username': {'$first': '$username'},
+                                'max_investment': {'$max': '$initial_investment'},
+                                'total_investment': {'$sum': '$initial_investment'},
+                                'total_profit_usd': {'$sum': '$profit_usd'},
+                                'trade_count': {'$sum': 1}
+                            }
+                        },
+                        {'$sort': {'max_investment': -1}},
+                        {'$limit': limit}
+                    ],
+                    'tokens': [
+                        *_token_group_stages('total_trades'),
+                        {'$sort': {'total_profit_usd': -1}},
+                        {'$limit': limit},
+                        _TOKEN_AVG_PROFIT_STAGE
+                    ],
+                    'trending': [
+                        {'$match': {'timestamp': {'$gte': trending_cutoff}}},
+                        *_token_group_stages('trade_count'),
+                        {'$sort': {'trade_count': -1}},
+                        {'$limit': limit}
+                    ]
+                }
+            }
+        ]
+        options = dict(_AGG_OPTS, hint=[('timestamp', -1)]) if since else _AGG_OPTS
+        result = list(self._hinted(self.pnls_collection.aggregate, pipeline, **options))
+        return result[0] if result else {}
     
+    @_db_safe("Error getting percent gain leaderboard", [])
+    def get_percent_gain_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get best percentage gain trades, read straight off the stored percent_gain index"""
+        return list(self.pnls_collection.find(
+            {'percent_gain': {'$gt': 0}}
+        ).sort('percent_gain', -1).limit(limit))
+    
+    @_db_safe("Error getting investment filtered leaderboard", [])
     def get_investment_filtered_leaderboard(self, min_investment: float = 0, max_investment: float = float('inf'), limit: int = 10) -> List[Dict[str, Any]]:
         """Get leaderboard filtered by investment range"""
-        try:
-            match_filter = {
-                'initial_investment': {'$gte': min_investment}
-            }
-            if max_investment != float('inf'):
-                match_filter['initial_investment']['$lte'] = max_investment
-            
-            pipeline = [
-                {'$match': match_filter},
-                {
-                    '$group': {
-                        '_id': '$username',  # Group by username instead of user_id
-                        'username': {'$first': '$username'},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'total_profit_sol': {'$sum': '$profit_sol'},
-                        'trade_count': {'$sum': 1},
-                        'avg_investment': {'$avg': '$initial_investment'}
-                    }
-                },
-                {'$sort': {'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting investment filtered leaderboard: {e}")
-            return []
+        match_filter = {
+            'initial_investment': {'$gte': min_investment}
+        }
+        if max_investment != float('inf'):
+            match_filter['initial_investment']['$lte'] = max_investment
+        
+        pipeline = [
+            {'$match': match_filter},
+            {
+                '$group': {
+                    '_id': '$username_lc',
+                    'username': {'$first': '$username'},  # Keep original username for display
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'total_profit_sol': {'$sum': '$profit_sol'},
+                    'trade_count': {'$sum': 1},
+                    'avg_investment': {'$avg': '$initial_investment'}
+                }
+            },
+            {'$sort': {'total_profit_usd': -1}},
+            {'$limit': limit}
+        ]
+        return self._cached(
+            ('investment_filtered', min_investment, max_investment, limit),
+            LEADERBOARD_CACHE_TTL,
+            lambda: list(self.pnls_collection.aggregate(pipeline, batchSize=limit, **_AGG_OPTS))
+        )
     
+    @_db_safe("Error getting random successful trade")
     def get_random_successful_trade(self) -> Optional[Dict[str, Any]]:
         """Get a random successful trade for inspiration"""
-        try:
-            pipeline = [
-                {
-                    '$match': {
-                        'profit_usd': {'$gt': 0}
-                    }
-                },
-                {'$sample': {'size': 1}}
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting random successful trade: {e}")
-            return None
+        pipeline = [
+            {
+                '$match': {
+                    'is_win': True
+                }
+            },
+            {'$sample': {'size': 1}}
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        return result[0] if result else None
     
+    @_db_safe("Error getting daily biggest winner")
     def get_daily_biggest_winner(self, date: datetime) -> Optional[Dict[str, Any]]:
         """Get biggest winner for a specific day"""
-        try:
-            start_date = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = start_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            result = self.pnls_collection.find(
-                {
-                    'timestamp': {'$gte': start_date, '$lte': end_date}
-                }
-            ).sort('profit_usd', -1).limit(1)
-            
-            return list(result)[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting daily biggest winner: {e}")
-            return None
+        start_date, end_date = _day_bounds(date.toordinal())
+        
+        # Without the hint the planner may walk the whole profit_usd index looking for a trade from that day
+        return self._hinted(
+            self.pnls_collection.find_one,
+            {
+                'timestamp': {'$gte': start_date, '$lt': end_date}
+            },
+            sort=[('profit_usd', -1)],
+            hint=[('timestamp', 1), ('profit_usd', -1)]
+        )
     
+    @_db_safe("Error searching trades by ticker", [])
     def search_trades_by_ticker(self, ticker: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search trades by ticker symbol"""
-        try:
-            return list(self.pnls_collection.find(
-                {'ticker': ticker.upper()},
-                {'_id': 0}
-            ).sort('timestamp', -1).limit(limit))
-        except Exception as e:
-            logger.error(f"Error searching trades by ticker: {e}")
-            return []
+        return list(self.pnls_collection.find(
+            {'ticker': ticker.upper()},
+            {'_id': 0}
+        ).sort('timestamp', -1).limit(limit))
     
+    @_db_safe("Error searching trades by username", [])
     def search_trades_by_username(self, username: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search trades by username"""
-        try:
-            match_query = self.create_username_match_query(username=username)
-            return list(self.pnls_collection.find(
-                match_query,
-                {'_id': 0}
-            ).sort('timestamp', -1).limit(limit))
-        except Exception as e:
-            logger.error(f"Error searching trades by username: {e}")
-            return []
+        return list(self.pnls_collection.find(
+            {'username_lc': normalize_username(username)},
+            {'_id': 0}
+        ).sort('timestamp', -1).limit(limit))
     
+    @_db_safe("Error getting top gainer")
     def get_top_gainer(self, period: str) -> Optional[Dict[str, Any]]:
         """Get top gainer for specified period"""
-        try:
-            now = datetime.now(timezone.utc)
-            
-            if period == 'today':
-                start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            elif period == 'week':
-                start_date = now - timedelta(days=7)
-            elif period == 'month':
-                start_date = now - timedelta(days=30)
-            else:
-                return None
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': start_date},
-                        'initial_investment': {'$gt': 0}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'percent_gain': {
-                            '$multiply': [
-                                {'$divide': ['$profit_usd', '$initial_investment']},
-                                100
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'percent_gain': -1}},
-                {'$limit': 1}
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting top gainer: {e}")
+        if period == 'today':
+            start_date, _ = _day_bounds(datetime.now(timezone.utc).toordinal())
+        elif period == 'week':
+            start_date = _rolling_start(7)
+        elif period == 'month':
+            start_date = _rolling_start(30)
+        else:
             return None
+        
+        # Keyed by period: a rolling window start moves every call but the leader rarely does
+        return self._cached(('top_gainer', period), LEADERBOARD_CACHE_TTL, lambda: self.pnls_collection.find_one(
+            {
+                'timestamp': {'$gte': start_date},
+                'percent_gain': {'$ne': None}
+            },
+            {'_id': 0, 'username': 1, 'ticker': 1, 'percent_gain': 1, 'profit_usd': 1, 'timestamp': 1},
+            sort=[('percent_gain', -1)]
+        ))
 
     # Placeholder methods for advanced features (to be implemented based on requirements)
+    @_db_safe("Error getting consistency leaderboard", [])
     def get_consistency_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get most consistent traders (placeholder - needs more complex logic)"""
-        # For now, return traders with best win rate and multiple trades
-        try:
-            pipeline = [
-                {
-                    '$group': {
-                        '_id': '$username',  # Group by username instead of user_id
-                        'username': {'$first': '$username'},
-                        'total_trades': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_profit_usd': {'$sum': '$profit_usd'}
-                    }
-                },
-                {
-                    '$match': {
-                        'total_trades': {'$gte': 3}  # At least 3 trades
-                    }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$total_trades']},
-                                100
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'win_rate': -1, 'total_profit_usd': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting consistency leaderboard: {e}")
-            return []
+        """Get most consistent traders: best win rate among users with at least 3 trades"""
+        return self._cached(
+            ('consistency', limit),
+            STATS_CACHE_TTL,
+            lambda: self._materialized_leaderboard('consistency', limit)
+        )
     
+    @_db_safe("Error getting loss leaderboard", [])
     def get_loss_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get transparency leaderboard (biggest losses)"""
-        try:
-            return list(self.pnls_collection.find(
-                {'profit_usd': {'$lt': 0}},
-                {'_id': 0}
-            ).sort('profit_usd', 1).limit(limit))
-        except Exception as e:
-            logger.error(f"Error getting loss leaderboard: {e}")
-            return []
+        return list(self.pnls_collection.find(
+            {'profit_usd': {'$lt': 0}},
+            {'_id': 0, 'username': 1, 'ticker': 1, 'profit_usd': 1, 'timestamp': 1}
+        ).sort('profit_usd', 1).limit(limit))
     
-    def get_user_achievements(self, user_id: str, username: str) -> Dict[str, Any]:
-        """Get user achievements based on trading patterns"""
-        try:
-            stats = self.get_user_stats(user_id, username)
-            if not stats:
-                return {'total_achievements': 0, 'achievements': [], 'next_milestone': 'First Trade'}
-            
-            achievements = []
-            
-            # Trading volume achievements
-            if stats['trade_count'] >= 1:
-                achievements.append("🎯 First Trade")
-            if stats['trade_count'] >= 10:
-                achievements.append("🔟 Ten Trades")
-            if stats['trade_count'] >= 50:
-                achievements.append("📊 Active Trader")
-            if stats['trade_count'] >= 100:
-                achievements.append("💎 Trading Veteran")
-            
-            # Profit achievements
-            if stats['total_profit_usd'] >= 100:
-                achievements.append("💰 First $100")
-            if stats['total_profit_usd'] >= 1000:
-                achievements.append("🚀 Thousand Club")
-            if stats['total_profit_usd'] >= 10000:
-                achievements.append("🏆 Ten K Club")
-            
-            # Win rate achievements
-            if stats['win_rate'] >= 50:
-                achievements.append("⚖️ Balanced Trader")
-            if stats['win_rate'] >= 70:
-                achievements.append("🎯 Sharp Shooter")
-            if stats['win_rate'] >= 90:
-                achievements.append("👑 Almost Perfect")
-            
-            # ROI achievements
-            if stats.get('roi', 0) >= 50:
-                achievements.append("📈 Growth Hacker")
-            if stats.get('roi', 0) >= 100:
-                achievements.append("🔥 Double Down")
-            
-            return {
-                'total_achievements': len(achievements),
-                'achievements': achievements,
-                'next_milestone': self._get_next_milestone(stats)
-            }
-        except Exception as e:
-            logger.error(f"Error getting achievements: {e}")
+    @_db_safe("Error getting achievements", {'total_achievements': 0, 'achievements': [], 'next_milestone': 'First Trade'})
+    def get_user_achievements(self, user_id: str, username: str,
+                              stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get user achievements based on trading patterns; pass stats already fetched to skip the lookup"""
+        stats = stats or self.get_user_stats(user_id, username)
+        if not stats:
             return {'total_achievements': 0, 'achievements': [], 'next_milestone': 'First Trade'}
+        
+        achievements = []
+        for field, thresholds, labels in _ACHIEVEMENT_TIERS:
+            achievements.extend(labels[:bisect.bisect_right(thresholds, stats.get(field, 0))])
+        
+        return {
+            'total_achievements': len(achievements),
+            'achievements': achievements,
+            'next_milestone': self._get_next_milestone(stats)
+        }
     
     def _get_next_milestone(self, stats: dict) -> str:
         """Get next milestone for user"""
-        if stats['trade_count'] < 1:
-            return "First Trade"
-        elif stats['trade_count'] < 10:
-            return f"Reach 10 trades ({10 - stats['trade_count']} to go)"
-        elif stats['total_profit_usd'] < 100:
-            return f"Reach $100 profit (${100 - stats['total_profit_usd']:.2f} to go)"
-        elif stats['total_profit_usd'] < 1000:
-            return f"Reach $1000 profit (${1000 - stats['total_profit_usd']:.2f} to go)"
-        elif stats['win_rate'] < 70:
-            return f"Reach 70% win rate ({70 - stats['win_rate']:.1f}% to go)"
-        else:
-            return "Master Trader Status!"
+        for field, target, template in _NEXT_MILESTONES:
+            value = stats.get(field, 0)
+            if value < target:
+                return template.format(remaining=target - value)
+        return "Master Trader Status!"
     
+    @_db_safe("Error getting user streaks", _NO_STREAKS)
     def get_user_streaks(self, user_id: str, username: str) -> Dict[str, Any]:
         """Get user winning/losing streaks"""
+        match_query = self.create_indexed_user_query(user_id, username)
+        if not match_query:
+            return dict(_NO_STREAKS)
         try:
-            # Get user's trades in chronological order
-            match_query = self.create_username_match_query(user_id, username)
-            trades = list(self.pnls_collection.find(match_query).sort('timestamp', 1))
-            
-            if not trades:
-                return {
-                    'current_streak': 0,
-                    'longest_win_streak': 0,
-                    'longest_loss_streak': 0,
-                    'streak_type': 'neutral'
-                }
-            
-            current_streak = 0
-            longest_win_streak = 0
-            longest_loss_streak = 0
-            current_win_streak = 0
-            current_loss_streak = 0
-            
-            for trade in trades:
-                profit = trade.get('profit_usd', 0)
-                
-                if profit > 0:  # Win
-                    current_win_streak += 1
-                    current_loss_streak = 0
-                    longest_win_streak = max(longest_win_streak, current_win_streak)
-                else:  # Loss
-                    current_loss_streak += 1
-                    current_win_streak = 0
-                    longest_loss_streak = max(longest_loss_streak, current_loss_streak)
-            
-            # Determine current streak
-            if current_win_streak > 0:
-                current_streak = current_win_streak
-                streak_type = 'winning'
-            elif current_loss_streak > 0:
-                current_streak = current_loss_streak
-                streak_type = 'losing'
-            else:
-                current_streak = 0
-                streak_type = 'neutral'
-            
-            return {
-                'current_streak': current_streak,
-                'longest_win_streak': longest_win_streak,
-                'longest_loss_streak': longest_loss_streak,
-                'streak_type': streak_type
-            }
-        except Exception as e:
-            logger.error(f"Error getting user streaks: {e}")
-            return {
-                'current_streak': 0,
-                'longest_win_streak': 0,
-                'longest_loss_streak': 0,
-                'streak_type': 'neutral'
-            }
+            streaks = self._aggregate_streaks(match_query)
+        except OperationFailure as e:
+            # Servers before MongoDB 5.0 lack $setWindowFields; find the runs client-side instead.
+            # Any other failure (e.g. a maxTimeMS timeout) is not worth a full client-side scan
+            if e.code != _UNRECOGNIZED_STAGE_ERROR:
+                raise
+            trades = self.pnls_collection.find(match_query, {'_id': 0, 'profit_usd': 1}).sort([('timestamp', 1), ('_id', 1)])
+            streaks = _streaks_from_profits(
+                np.fromiter((trade.get('profit_usd') or 0 for trade in trades), dtype=np.float64)
+            )
+        return streaks or dict(_NO_STREAKS)
     
-    def get_user_milestones(self, user_id: str, username: str) -> Dict[str, Any]:
-        """Get user milestones and progress"""
-        try:
-            stats = self.get_user_stats(user_id, username)
-            if not stats:
-                return {
-                    'completed_milestones': [],
-                    'next_milestone': 'Complete first trade',
-                    'progress': 0
+    def _aggregate_streaks(self, match_query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Compute a user's streaks server-side; None when they have no trades"""
+        # Number each trade overall and within its win/loss partition; the difference
+        # is constant along a run of consecutive wins or losses, so it identifies the run
+        pipeline = [
+            {'$match': match_query},
+            {
+                '$setWindowFields': {
+                    'sortBy': {'timestamp': 1, '_id': 1},
+                    'output': {'seq': {'$documentNumber': {}}}
+                }
+            },
+            {
+                '$setWindowFields': {
+                    'partitionBy': '$is_win',
+                    'sortBy': {'timestamp': 1, '_id': 1},
+                    'output': {'seq_in_result': {'$documentNumber': {}}}
+                }
+            },
+            {
+                '$group': {
+                    '_id': {
+                        'is_win': '$is_win',
+                        'run': {'$subtract': ['$seq', '$seq_in_result']}
+                    },
+                    'length': {'$sum': 1},
+                    'last_seq': {'$max': '$seq'}
+                }
+            },
+            {'$sort': {'last_seq': -1}},
+            {
+                '$group': {
+                    '_id': None,
+                    'longest_win_streak': {
+                        '$max': {'$cond': ['$_id.is_win', '$length', 0]}
+                    },
+                    'longest_loss_streak': {
+                        '$max': {'$cond': ['$_id.is_win', 0, '$length']}
+                    },
+                    'last_is_win': {'$first': '$_id.is_win'},
+                    'current_streak': {'$first': '$length'}
                 }
-            
-            completed_milestones = []
-            milestones = [
-                {'name': 'First Trade', 'target': 1, 'type': 'trades', 'reward': '🎯'},
-                {'name': 'Five Trades', 'target': 5, 'type': 'trades', 'reward': '🏃'},
-                {'name': 'Ten Trades', 'target': 10, 'type': 'trades', 'reward': '🔟'},
-                {'name': 'First Profit', 'target': 1, 'type': 'profit', 'reward': '💰'},
-                {'name': '$100 Club', 'target': 100, 'type': 'profit', 'reward': '💯'},
-                {'name': '$500 Club', 'target': 500, 'type': 'profit', 'reward': '🚀'},
-                {'name': '$1000 Club', 'target': 1000, 'type': 'profit', 'reward': '💎'},
-                {'name': '50% Win Rate', 'target': 50, 'type': 'winrate', 'reward': '⚖️'},
-                {'name': '70% Win Rate', 'target': 70, 'type': 'winrate', 'reward': '🎯'},
-            ]
-            
-            next_milestone = None
-            progress = 0
-            
-            for milestone in milestones:
-                current_value = 0
-                if milestone['type'] == 'trades':
-                    current_value = stats['trade_count']
-                elif milestone['type'] == 'profit':
-                    current_value = max(0, stats['total_profit_usd'])
-                elif milestone['type'] == 'winrate':
-                    current_value = stats['win_rate']
-                
-                if current_value >= milestone['target']:
-                    completed_milestones.append(f"{milestone['reward']} {milestone['name']}")
-                elif not next_milestone:
-                    next_milestone = milestone['name']
-                    progress = min(100, (current_value / milestone['target']) * 100)
-            
-            return {
-                'completed_milestones': completed_milestones,
-                'next_milestone': next_milestone or 'All milestones completed!',
-                'progress': progress
             }
-        except Exception as e:
-            logger.error(f"Error getting user milestones: {e}")
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        if not result:
+            return None
+        
+        streaks = result[0]
+        return {
+            'current_streak': streaks['current_streak'],
+            'longest_win_streak': streaks['longest_win_streak'],
+            'longest_loss_streak': streaks['longest_loss_streak'],
+            'streak_type': 'winning' if streaks['last_is_win'] else 'losing'
+        }
+    
+    @_db_safe("Error getting user milestones", {
+        'completed_milestones': [],
+        'next_milestone': 'Complete first trade',
+        'progress': 0
+    })
+    def get_user_milestones(self, user_id: str, username: str,
+                            stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Get user milestones and progress; pass stats already fetched to skip the lookup"""
+        stats = stats or self.get_user_stats(user_id, username)
+        if not stats:
             return {
                 'completed_milestones': [],
                 'next_milestone': 'Complete first trade',
                 'progress': 0
             }
+        
+        completed_milestones = []
+        next_milestone = None
+        progress = 0
+        
+        for field, targets, names, rewards in _MILESTONE_TIERS:
+            current_value = stats.get(field, 0)
+            if field == 'total_profit_usd':
+                current_value = max(0, current_value)
+            
+            reached = bisect.bisect_right(targets, current_value)
+            completed_milestones.extend(
+                f"{reward} {name}" for reward, name in zip(rewards[:reached], names[:reached])
+            )
+            if not next_milestone and reached < len(targets):
+                next_milestone = names[reached]
+                progress = min(100, (current_value / targets[reached]) * 100)
+        
+        return {
+            'completed_milestones': completed_milestones,
+            'next_milestone': next_milestone or 'All milestones completed!',
+            'progress': progress
+        }
     
+    @_db_safe("Error getting hall of fame", [])
     def get_hall_of_fame(self) -> List[Dict[str, Any]]:
         """Get hall of fame legends - top performers across multiple categories"""
+        return self._cached(('hall_of_fame',), TRENDS_CACHE_TTL, self._build_hall_of_fame)
+    
+    def _build_hall_of_fame(self) -> List[Dict[str, Any]]:
+        """Collect the leader of each hall of fame category"""
+        legends = []
+        
+        # Rank-1 row of every materialized category in one indexed read; while they are behind
+        # this process's writes, each category is ranked from the rollups below instead
+        leaders = {
+            row['category']: row
+            for row in self.leaderboards.find({'category': {'$in': list(_MATERIALIZED_LEADERBOARDS)}, 'rank': 1})
+        } if self._leaderboards_current() else {}
+        
+        # 1. PROFIT EMPEROR - Highest total profit
+        profit_emperor = leaders.get('profit') or self.get_profit_goat()
+        if profit_emperor:
+            legends.append({
+                'category': '👑 PROFIT EMPEROR',
+                'username': profit_emperor['username'],
+                'achievement': f"${profit_emperor['total_profit_usd']:,.0f}",
+                'subtitle': f"{profit_emperor.get('trade_count', 0)} trades",
+                'description': "Ruler of the profit realm",
+                'icon': '💰',
+                'rank': 1
+            })
+        
+        # 2. ROI DEITY - Best percentage returns
+        roi_leaders = [leaders['roi']] if 'roi' in leaders else self.get_roi_leaderboard(1)
+        if roi_leaders:
+            roi_deity = roi_leaders[0]
+            legends.append({
+                'category': '🚀 ROI DEITY',
+                'username': roi_deity['username'],
+                'achievement': f"{roi_deity.get('roi_percentage', 0):.1f}%",
+                'subtitle': f"${roi_deity.get('total_profit_usd', 0):,.0f} profit",
+                'description': "Master of percentage perfection",
+                'icon': '📈',
+                'rank': 2
+            })
+        
+        # 3. VOLUME TITAN - Highest total investment
+        volume_leaders = [leaders['whales']] if 'whales' in leaders else self.get_whale_leaderboard(1)
+        if volume_leaders:
+            volume_titan = volume_leaders[0]
+            legends.append({
+                'category': '🐋 VOLUME TITAN',
+                'username': volume_titan['username'],
+                'achievement': f"${volume_titan.get('total_investment', 0):,.0f}",
+                'subtitle': f"{volume_titan.get('trade_count', 0)} trades",
+                'description': "Commander of capital deployment",
+                'icon': '💎',
+                'rank': 3
+            })
+        
+        # 4. TRADE GLADIATOR - Most total trades
         try:
-            legends = []
-            
-            # 1. PROFIT EMPEROR - Highest total profit
-            profit_emperor = self.get_profit_goat()
-            if profit_emperor:
+            trade_result = [leaders['trade_count']] if 'trade_count' in leaders else self._rollup_leaderboard('trade_count', 1)
+            if trade_result:
+                trade_gladiator = trade_result[0]
                 legends.append({
-                    'category': '👑 PROFIT EMPEROR',
-                    'username': profit_emperor['username'],
-                    'achievement': f"${profit_emperor['total_profit_usd']:,.0f}",
-                    'subtitle': f"{profit_emperor.get('trade_count', 0)} trades",
-                    'description': "Ruler of the profit realm",
-                    'icon': '💰',
-                    'rank': 1
+                    'category': '⚔️ TRADE GLADIATOR',
+                    'username': trade_gladiator['username'],
+                    'achievement': f"{trade_gladiator['total_trades']:,} trades",
+                    'subtitle': f"${trade_gladiator.get('total_profit_usd', 0):,.0f} profit",
+                    'description': "Warrior of trading volume",
+                    'icon': '⚡',
+                    'rank': 4
                 })
-            
-            # 2. ROI DEITY - Best percentage returns
-            roi_leaders = self.get_roi_leaderboard(1)
-            if roi_leaders:
-                roi_deity = roi_leaders[0]
+        except Exception as e:
+            logger.warning(f"Could not get trade gladiator: {e}")
+        
+        # 5. PRECISION MASTER - Highest win rate (min 10 trades)
+        try:
+            precision_result = [leaders['precision']] if 'precision' in leaders else self._rollup_leaderboard('precision', 1)
+            if precision_result:
+                precision_master = precision_result[0]
                 legends.append({
-                    'category': '🚀 ROI DEITY',
-                    'username': roi_deity['username'],
-                    'achievement': f"{roi_deity.get('roi_percentage', 0):.1f}%",
-                    'subtitle': f"${roi_deity.get('total_profit_usd', 0):,.0f} profit",
-                    'description': "Master of percentage perfection",
-                    'icon': '📈',
-                    'rank': 2
+                    'category': '🎯 PRECISION MASTER',
+                    'username': precision_master['username'],
+                    'achievement': f"{precision_master['win_rate']:.1f}%",
+                    'subtitle': f"{precision_master['total_trades']} trades",
+                    'description': "Archer of accuracy",
+                    'icon': '🏹',
+                    'rank': 5
                 })
-            
-            # 3. VOLUME TITAN - Highest total investment
-            volume_leaders = self.get_whale_leaderboard(1)
-            if volume_leaders:
-                volume_titan = volume_leaders[0]
+        except Exception as e:
+            logger.warning(f"Could not get precision master: {e}")
+        
+        # 6. BATTLE EMPEROR - Most battle points
+        try:
+            battle_leaders = self.get_battle_leaderboard(1)
+            if battle_leaders:
+                battle_emperor = battle_leaders[0]
+                total_points = battle_emperor.get('profit_battle_points', 0) + battle_emperor.get('trade_war_points', 0)
+                battles_won = battle_emperor.get('battles_won', 0)
                 legends.append({
-                    'category': '🐋 VOLUME TITAN',
-                    'username': volume_titan['username'],
-                    'achievement': f"${volume_titan.get('total_investment', 0):,.0f}",
-                    'subtitle': f"{volume_titan.get('trade_count', 0)} trades",
-                    'description': "Commander of capital deployment",
-                    'icon': '💎',
-                    'rank': 3
+                    'category': '🏛️ BATTLE EMPEROR',
+                    'username': battle_emperor['username'],
+                    'achievement': f"{total_points} pts",
+                    'subtitle': f"{battles_won} victories",
+                    'description': "Conqueror of the colosseum",
+                    'icon': '⚔️',
+                    'rank': 6
                 })
-            
-            # 4. TRADE GLADIATOR - Most total trades
-            try:
-                trade_pipeline = [
-                    {'$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},
-                        'total_trades': {'$sum': 1},
-                        'total_profit_usd': {'$sum': '$profit_usd'},
-                        'win_rate': {
-                            '$avg': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 100, 0]
-                            }
-                        }
-                    }},
-                    {'$sort': {'total_trades': -1}},
-                    {'$limit': 1}
-                ]
-                trade_result = list(self.pnls_collection.aggregate(trade_pipeline))
-                if trade_result:
-                    trade_gladiator = trade_result[0]
-                    legends.append({
-                        'category': '⚔️ TRADE GLADIATOR',
-                        'username': trade_gladiator['username'],
-                        'achievement': f"{trade_gladiator['total_trades']:,} trades",
-                        'subtitle': f"${trade_gladiator.get('total_profit_usd', 0):,.0f} profit",
-                        'description': "Warrior of trading volume",
-                        'icon': '⚡',
-                        'rank': 4
-                    })
-            except Exception as e:
-                logger.warning(f"Could not get trade gladiator: {e}")
-            
-            # 5. PRECISION MASTER - Highest win rate (min 10 trades)
-            try:
-                precision_pipeline = [
-                    {'$addFields': {
-                        'normalized_username': {
-                            '$toLower': {
-                                '$cond': [
-                                    {'$eq': [{'$substr': ['$username', 0, 1]}, '@']},
-                                    {'$substr': ['$username', 1, -1]},
-                                    '$username'
-                                ]
-                            }
-                        }
-                    }},
-                    {'$group': {
-                        '_id': '$normalized_username',
-                        'username': {'$first': '$username'},
-                        'total_trades': {'$sum': 1},
-                        'winning_trades': {
-                            '$sum': {'$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]}
-                        },
-                        'total_profit_usd': {'$sum': '$profit_usd'}
-                    }},
-                    {'$match': {'total_trades': {'$gte': 10}}},
-                    {'$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$total_trades']},
-                                100
-                            ]
-                        }
-                    }},
-                    {'$sort': {'win_rate': -1}},
-                    {'$limit': 1}
-                ]
-                precision_result = list(self.pnls_collection.aggregate(precision_pipeline))
-                if precision_result:
-                    precision_master = precision_result[0]
-                    legends.append({
-                        'category': '🎯 PRECISION MASTER',
-                        'username': precision_master['username'],
-                        'achievement': f"{precision_master['win_rate']:.1f}%",
-                        'subtitle': f"{precision_master['total_trades']} trades",
-                        'description': "Archer of accuracy",
-                        'icon': '🏹',
-                        'rank': 5
-                    })
-            except Exception as e:
-                logger.warning(f"Could not get precision master: {e}")
-            
-            # 6. BATTLE EMPEROR - Most battle points
-            try:
-                battle_leaders = self.get_battle_leaderboard(1)
-                if battle_leaders:
-                    battle_emperor = battle_leaders[0]
-                    total_points = battle_emperor.get('profit_battle_points', 0) + battle_emperor.get('trade_war_points', 0)
-                    battles_won = battle_emperor.get('battles_won', 0)
-                    legends.append({
-                        'category': '🏛️ BATTLE EMPEROR',
-                        'username': battle_emperor['username'],
-                        'achievement': f"{total_points} pts",
-                        'subtitle': f"{battles_won} victories",
-                        'description': "Conqueror of the colosseum",
-                        'icon': '⚔️',
-                        'rank': 6
-                    })
-            except Exception as e:
-                logger.warning(f"Could not get battle emperor: {e}")
-            
-            # 7. SINGLE TRADE LEGEND - Biggest single trade profit
-            try:
-                single_trade_pipeline = [
-                    {'$sort': {'profit_usd': -1}},
-                    {'$limit': 1}
-                ]
-                single_trade_result = list(self.pnls_collection.aggregate(single_trade_pipeline))
-                if single_trade_result:
-                    single_legend = single_trade_result[0]
-                    legends.append({
-                        'category': '💥 SINGLE TRADE LEGEND',
-                        'username': single_legend['username'],
-                        'achievement': f"${single_legend['profit_usd']:,.0f}",
-                        'subtitle': f"{single_legend.get('ticker', 'Unknown')} trade",
-                        'description': "One trade to rule them all",
-                        'icon': '🌟',
-                        'rank': 7
-                    })
-            except Exception as e:
-                logger.warning(f"Could not get single trade legend: {e}")
-            
-            return legends
-            
         except Exception as e:
-            logger.error(f"Error getting hall of fame: {e}")
-            return []
-    
-    def get_market_sentiment(self) -> Dict[str, Any]:
-        """Get market sentiment analysis"""
+            logger.warning(f"Could not get battle emperor: {e}")
+        
+        # 7. SINGLE TRADE LEGEND - Biggest single trade profit
         try:
-            week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': week_ago}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'profitable_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_profit': {'$sum': '$profit_usd'},
-                        'avg_profit': {'$avg': '$profit_usd'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'success_rate': {
-                            '$multiply': [
-                                {'$divide': ['$profitable_trades', '$total_trades']},
-                                100
-                            ]
+            single_legend = self.pnls_collection.find_one(
+                {},
+                {'_id': 0, 'username': 1, 'ticker': 1, 'profit_usd': 1},
+                sort=[('profit_usd', -1)]
+            )
+            if single_legend:
+                legends.append({
+                    'category': '💥 SINGLE TRADE LEGEND',
+                    'username': single_legend['username'],
+                    'achievement': f"${single_legend['profit_usd']:,.0f}",
+                    'subtitle': f"{single_legend.get('ticker', 'Unknown')} trade",
+                    'description': "One trade to rule them all",
+                    'icon': '🌟',
+                    'rank': 7
+                })
+        except Exception as e:
+            logger.warning(f"Could not get single trade legend: {e}")
+        
+        return legends
+    
+    @_db_safe("Error getting market sentiment", {'sentiment': 'Unknown', 'total_trades': 0})
+    def get_market_sentiment(self) -> Dict[str, Any]:
+        """Get market sentiment analysis"""
+        week_ago = _rolling_start(7)
+        
+        pipeline = [
+            {
+                '$match': {
+                    'timestamp': {'$gte': week_ago}
+                }
+            },
+            {
+                '$group': {
+                    '_id': None,
+                    'total_trades': {'$sum': 1},
+                    'profitable_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
                         }
+                    },
+                    'total_profit': {'$sum': '$profit_usd'},
+                    'avg_profit': {'$avg': '$profit_usd'}
+                }
+            },
+            {
+                '$addFields': {
+                    'success_rate': {
+                        '$multiply': [
+                            {'$divide': ['$profitable_trades', '$total_trades']},
+                            100
+                        ]
                     }
                 }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            if result:
-                sentiment = result[0]
-                if sentiment['success_rate'] > 60:
-                    sentiment['sentiment'] = 'Bullish 🐂'
-                elif sentiment['success_rate'] > 40:
-                    sentiment['sentiment'] = 'Neutral 🦆'
-                else:
-                    sentiment['sentiment'] = 'Bearish 🐻'
-                return sentiment
-            return {'sentiment': 'Unknown', 'total_trades': 0}
-        except Exception as e:
-            logger.error(f"Error getting market sentiment: {e}")
-            return {'sentiment': 'Unknown', 'total_trades': 0}
+            }
+        ]
+        result = self._cached(
+            ('sentiment',),
+            TRENDS_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, hint=[('timestamp', -1)], **_AGG_OPTS))
+        )
+        if result:
+            sentiment = result[0]
+            if sentiment['success_rate'] > 60:
+                sentiment['sentiment'] = 'Bullish 🐂'
+            elif sentiment['success_rate'] > 40:
+                sentiment['sentiment'] = 'Neutral 🦆'
+            else:
+                sentiment['sentiment'] = 'Bearish 🐻'
+            return sentiment
+        return {'sentiment': 'Unknown', 'total_trades': 0}
     
+    @_db_safe("Error getting token popularity", [])
     def get_token_popularity(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get token popularity index"""
-        try:
-            month_ago = datetime.now(timezone.utc) - timedelta(days=30)
-            
-            pipeline = [
-                {
-                    '$match': {
-                        'timestamp': {'$gte': month_ago}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$ticker',
-                        'trade_frequency': {'$sum': 1},
-                        'unique_traders': {'$addToSet': '$username'},
-                        'total_volume': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'trader_count': {'$size': '$unique_traders'},
-                        'popularity_score': {
-                            '$add': [
-                                '$trade_frequency',
-                                {'$multiply': ['$trader_count', 2]}
-                            ]
-                        }
+        month_ago = _rolling_start(30)
+        
+        pipeline = [
+            {
+                '$match': {
+                    'timestamp': {'$gte': month_ago}
+                }
+            },
+            {
+                # Count distinct traders as (ticker, trader) groups rather than accumulating a set per token
+                '$group': {
+                    '_id': {'ticker': '$ticker', 'trader': '$username_lc'},
+                    'trade_frequency': {'$sum': 1},
+                    'total_volume': {'$sum': '$initial_investment'}
+                }
+            },
+            {
+                '$group': {
+                    '_id': '$_id.ticker',
+                    'trade_frequency': {'$sum': '$trade_frequency'},
+                    'trader_count': {'$sum': 1},
+                    'total_volume': {'$sum': '$total_volume'}
+                }
+            },
+            {
+                '$addFields': {
+                    'popularity_score': {
+                        '$add': ['$trade_frequency', {'$multiply': ['$trader_count', 2]}]
                     }
-                },
-                {'$sort': {'popularity_score': -1}},
-                {'$limit': limit}
-            ]
-            return list(self.pnls_collection.aggregate(pipeline))
-        except Exception as e:
-            logger.error(f"Error getting token popularity: {e}")
-            return []
+                }
+            },
+            {'$sort': {'popularity_score': -1}},
+            {'$limit': limit}
+        ]
+        return self._cached(
+            ('popularity', limit),
+            TRENDS_CACHE_TTL,
+            lambda: list(self._hinted(self.pnls_collection.aggregate, pipeline, batchSize=limit, hint=[('timestamp', -1)], **_AGG_OPTS))
+        )
     
+    @_db_safe("Error getting token profitability")
     def get_token_profitability(self, ticker: str) -> Optional[Dict[str, Any]]:
         """Get token profitability analysis"""
-        try:
-            pipeline = [
-                {
-                    '$match': {
-                        'ticker': ticker.upper()
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'successful_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'total_profit': {'$sum': '$profit_usd'},
-                        'avg_profit': {'$avg': '$profit_usd'},
-                        'best_trade': {'$max': '$profit_usd'},
-                        'worst_trade': {'$min': '$profit_usd'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'success_rate': {
-                            '$multiply': [
-                                {'$divide': ['$successful_trades', '$total_trades']},
-                                100
-                            ]
+        pipeline = [
+            {
+                '$match': {
+                    'ticker': ticker.upper()
+                }
+            },
+            {
+                '$group': {
+                    '_id': None,
+                    'total_trades': {'$sum': 1},
+                    'successful_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
                         }
+                    },
+                    'total_profit': {'$sum': '$profit_usd'},
+                    'avg_profit': {'$avg': '$profit_usd'},
+                    'best_trade': {'$max': '$profit_usd'},
+                    'worst_trade': {'$min': '$profit_usd'}
+                }
+            },
+            {
+                '$addFields': {
+                    'success_rate': {
+                        '$multiply': [
+                            {'$divide': ['$successful_trades', '$total_trades']},
+                            100
+                        ]
                     }
                 }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting token profitability: {e}")
-            return None
+            }
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        return result[0] if result else None
     
+    @_db_safe("Error getting time trends", {
+        'best_day': 'Monday',
+        'best_hour': '10:00 AM',
+        'trading_volume_by_day': {},
+        'success_rate_by_hour': {}
+    })
     def get_time_trends(self) -> Dict[str, Any]:
         """Get time-based trading trends"""
-        try:
-            # Aggregate by day of week
-            day_pipeline = [
-                {
-                    '$addFields': {
-                        'day_of_week': {'$dayOfWeek': '$timestamp'},
-                        'hour': {'$hour': '$timestamp'}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': '$day_of_week',
-                        'total_trades': {'$sum': 1},
-                        'profitable_trades': {
-                            '$sum': {'$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]}
-                        },
-                        'avg_profit': {'$avg': '$profit_usd'}
-                    }
-                },
-                {
-                    '$addFields': {
-                        'success_rate': {
-                            '$multiply': [
-                                {'$divide': ['$profitable_trades', '$total_trades']},
-                                100
-                            ]
-                        }
-                    }
-                },
-                {'$sort': {'success_rate': -1}}
-            ]
-            
-            day_results = list(self.pnls_collection.aggregate(day_pipeline))
-            
-            # Map day numbers to names
-            day_names = {1: 'Sunday', 2: 'Monday', 3: 'Tuesday', 4: 'Wednesday', 
-                        5: 'Thursday', 6: 'Friday', 7: 'Saturday'}
-            
-            best_day = 'Monday'
-            if day_results:
-                best_day = day_names.get(day_results[0]['_id'], 'Monday')
-            
-            # Aggregate by hour
-            hour_pipeline = [
-                {
-                    '$addFields': {
-                        'hour': {'$hour': '$timestamp'}
-                    }
-                },
+        def success_by(field: str) -> List[Dict[str, Any]]:
+            return [
                 {
                     '$group': {
-                        '_id': '$hour',
+                        '_id': f'${field}',
                         'total_trades': {'$sum': 1},
                         'profitable_trades': {
                             '$sum': {'$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]}
@@ -1606,226 +2126,266 @@ class DatabaseManager:
                             ]
                         }
                     }
-                },
-                {'$sort': {'success_rate': -1}}
-            ]
-            
-            hour_results = list(self.pnls_collection.aggregate(hour_pipeline))
-            
-            best_hour = '10:00 AM'
-            if hour_results:
-                best_hour_num = hour_results[0]['_id']
-                if best_hour_num == 0:
-                    best_hour = '12:00 AM'
-                elif best_hour_num < 12:
-                    best_hour = f'{best_hour_num}:00 AM'
-                elif best_hour_num == 12:
-                    best_hour = '12:00 PM'
-                else:
-                    best_hour = f'{best_hour_num - 12}:00 PM'
-            
-            # Build day volume data
-            day_volume = {}
-            for result in day_results:
-                day_name = day_names.get(result['_id'], 'Unknown')
-                day_volume[day_name] = {
-                    'trades': result['total_trades'],
-                    'success_rate': result['success_rate'],
-                    'avg_profit': result['avg_profit']
                 }
-            
-            # Build hour success rate data
-            hour_success = {}
-            for result in hour_results:
-                hour_key = f"{result['_id']}:00"
-                hour_success[hour_key] = {
-                    'success_rate': result['success_rate'],
-                    'trades': result['total_trades']
+            ]
+        
+        # Bucket every trade by its stored day of week and hour in a single covered index scan;
+        # trades without a date timestamp have no dow/hour and would form a None bucket
+        pipeline = [
+            {'$match': {'dow': {'$ne': None}, 'hour': {'$ne': None}}},
+            {'$project': {'_id': 0, 'dow': 1, 'hour': 1, 'profit_usd': 1}},
+            {
+                '$facet': {
+                    'by_day': success_by('dow'),
+                    'by_hour': success_by('hour')
                 }
-            
-            return {
-                'best_day': best_day,
-                'best_hour': best_hour,
-                'trading_volume_by_day': day_volume,
-                'success_rate_by_hour': hour_success
             }
-        except Exception as e:
-            logger.error(f"Error getting time trends: {e}")
-            return {
-                'best_day': 'Monday',
-                'best_hour': '10:00 AM',
-                'trading_volume_by_day': {},
-                'success_rate_by_hour': {}
+        ]
+        
+        result = self._cached(
+            ('time_trends',),
+            TRENDS_CACHE_TTL,
+            lambda: list(self._hinted(
+                self.pnls_collection.aggregate, pipeline, hint=[('dow', 1), ('hour', 1), ('profit_usd', 1)], **_AGG_OPTS
+            ))
+        )
+        # At most 7 day and 24 hour buckets: order them here rather than with a server-side sort
+        day_results = sorted(result[0]['by_day'], key=lambda bucket: bucket['_id']) if result else []
+        hour_results = sorted(result[0]['by_hour'], key=lambda bucket: bucket['_id']) if result else []
+        
+        # Map day numbers to names
+        day_names = {1: 'Sunday', 2: 'Monday', 3: 'Tuesday', 4: 'Wednesday', 
+                    5: 'Thursday', 6: 'Friday', 7: 'Saturday'}
+        
+        best_day = 'Monday'
+        if day_results:
+            best_day = day_names.get(max(day_results, key=lambda bucket: bucket['success_rate'])['_id'], 'Monday')
+        
+        best_hour = '10:00 AM'
+        if hour_results:
+            best_hour_num = max(hour_results, key=lambda bucket: bucket['success_rate'])['_id']
+            if best_hour_num == 0:
+                best_hour = '12:00 AM'
+            elif best_hour_num < 12:
+                best_hour = f'{best_hour_num}:00 AM'
+            elif best_hour_num == 12:
+                best_hour = '12:00 PM'
+            else:
+                best_hour = f'{best_hour_num - 12}:00 PM'
+        
+        # Build day volume data
+        day_volume = {}
+        for result in day_results:
+            day_name = day_names.get(result['_id'], 'Unknown')
+            day_volume[day_name] = {
+                'trades': result['total_trades'],
+                'success_rate': result['success_rate'],
+                'avg_profit': result['avg_profit']
+            }
+        
+        # Build hour success rate data
+        hour_success = {}
+        for result in hour_results:
+            hour_key = f"{result['_id']}:00"
+            hour_success[hour_key] = {
+                'success_rate': result['success_rate'],
+                'trades': result['total_trades']
             }
+        
+        return {
+            'best_day': best_day,
+            'best_hour': best_hour,
+            'trading_volume_by_day': day_volume,
+            'success_rate_by_hour': hour_success
+        }
+    
+    def iter_user_export_data(self, user_id: str, username: str, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Stream a user's personal data for export, newest first, buffering at most batch_size records at a time"""
+        user_query = self.create_indexed_user_query(user_id, username)
+        if not user_query:
+            return iter(())
+        return self.pnls_collection.find(
+            user_query,
+            _EXPORT_PROJECTION,
+            batch_size=batch_size
+        ).sort('timestamp', -1)
+    
+    @_db_safe("Error getting user export data")
+    def map_user_export_batches(self, user_id: str, username: str, fn: Callable[[List[Dict[str, Any]]], Any],
+                                batch_size: int = 1000) -> Optional[List[Any]]:
+        """Apply fn (e.g. pd.DataFrame) to a user's export data, batch_size records at a time; None if the read failed"""
+        return _map_batches(self.iter_user_export_data(user_id, username, batch_size), fn, batch_size)
     
+    @_db_safe("Error getting user export data", [])
     def get_user_export_data(self, user_id: str, username: str) -> List[Dict[str, Any]]:
-        """Get user's personal data for export"""
-        try:
-            match_query = self.create_username_match_query(user_id, username)
-            return list(self.pnls_collection.find(
-                match_query,
-                {'_id': 0}
-            ).sort('timestamp', -1))
-        except Exception as e:
-            logger.error(f"Error getting user export data: {e}")
-            return []
+        """Get user's personal data for export (loads every record; prefer map_user_export_batches)"""
+        return list(self.iter_user_export_data(user_id, username))
     
+    @_db_safe("Error getting user portfolio")
     def get_user_portfolio(self, user_id: str, username: str) -> Optional[Dict[str, Any]]:
         """Get user's token diversification"""
-        try:
-            match_query = self.create_username_match_query(user_id, username)
-            pipeline = [
-                {
-                    '$match': match_query
-                },
-                {
-                    '$group': {
-                        '_id': '$ticker',
-                        'trade_count': {'$sum': 1},
-                        'total_profit': {'$sum': '$profit_usd'},
-                        'total_investment': {'$sum': '$initial_investment'}
-                    }
-                },
-                {
-                    '$sort': {'total_profit': -1}
+        match_query = self.create_indexed_user_query(user_id, username)
+        if not match_query:
+            return None
+        pipeline = [
+            {'$match': match_query},
+            _PORTFOLIO_GROUP_STAGE
+        ]
+        return _portfolio_from_tokens(list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS)))
+    
+    @_db_safe("Error getting user profile bundle")
+    def get_user_profile_bundle(self, user_id: str, username: str) -> Optional[Dict[str, Any]]:
+        """Get stats, achievements, milestones, streaks and portfolio from one aggregation; None without trades"""
+        match_query = self.create_indexed_user_query(user_id, username)
+        if not match_query:
+            return None
+        
+        # One index seek on the user's trades, fanned out to each view
+        pipeline = [
+            {'$match': match_query},
+            {
+                '$facet': {
+                    'stats': [_USER_STATS_GROUP_STAGE, _USER_STATS_DERIVED_STAGE],
+                    'portfolio': [_PORTFOLIO_GROUP_STAGE],
+                    'profits': [
+                        {'$sort': {'timestamp': 1, '_id': 1}},
+                        {'$project': {'_id': 0, 'profit_usd': 1}}
+                    ]
                 }
-            ]
-            tokens = list(self.pnls_collection.aggregate(pipeline))
-            
-            if not tokens:
-                return None
-            
-            total_profit = sum(token['total_profit'] for token in tokens)
-            total_investment = sum(token['total_investment'] for token in tokens)
-            
-            return {
-                'tokens': tokens,
-                'total_tokens': len(tokens),
-                'total_profit': total_profit,
-                'total_investment': total_investment,
-                'diversification_score': min(len(tokens) * 10, 100)  # Simple score
             }
-        except Exception as e:
-            logger.error(f"Error getting user portfolio: {e}")
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        if not result or not result[0]['stats']:
             return None
+        
+        facets = result[0]
+        stats = facets['stats'][0]
+        profits = np.fromiter((trade.get('profit_usd', 0) for trade in facets['profits']), dtype=np.float64)
+        return {
+            'stats': stats,
+            'achievements': self.get_user_achievements(user_id, username, stats=stats),
+            'milestones': self.get_user_milestones(user_id, username, stats=stats),
+            'streaks': _streaks_from_profits(profits) or dict(_NO_STREAKS),
+            'portfolio': _portfolio_from_tokens(facets['portfolio'])
+        }
     
+    @_db_safe("Error getting user monthly report")
     def get_user_monthly_report(self, user_id: str, username: str, start_date: datetime) -> Optional[Dict[str, Any]]:
         """Get user's monthly trading report"""
-        try:
-            end_date = start_date + timedelta(days=32)
-            end_date = end_date.replace(day=1) - timedelta(days=1)  # Last day of month
-            
-            user_match_query = self.create_username_match_query(user_id, username)
-            pipeline = [
-                {
-                    '$match': {
-                        '$and': [
-                            user_match_query,
-                            {
-                                'timestamp': {
-                                    '$gte': start_date,
-                                    '$lte': end_date
-                                }
-                            }
-                        ]
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': None,
-                        'total_trades': {'$sum': 1},
-                        'total_profit': {'$sum': '$profit_usd'},
-                        'total_investment': {'$sum': '$initial_investment'},
-                        'winning_trades': {
-                            '$sum': {
-                                '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                            }
-                        },
-                        'best_trade': {'$max': '$profit_usd'},
-                        'worst_trade': {'$min': '$profit_usd'},
-                        'unique_tokens': {'$addToSet': '$ticker'}
+        start_date, end_date = _month_bounds(start_date.year, start_date.month)
+        
+        # Each user branch is then an equality plus timestamp range on its (field, timestamp) index
+        user_match_query = self.create_indexed_user_query(user_id, username)
+        if not user_match_query:
+            return None
+        pipeline = [
+            {
+                '$match': {
+                    **user_match_query,
+                    'timestamp': {
+                        '$gte': start_date,
+                        '$lt': end_date
                     }
-                },
-                {
-                    '$addFields': {
-                        'win_rate': {
-                            '$multiply': [
-                                {'$divide': ['$winning_trades', '$total_trades']},
-                                100
-                            ]
-                        },
-                        'roi': {
-                            '$multiply': [
-                                {'$divide': ['$total_profit', '$total_investment']},
-                                100
-                            ]
-                        },
-                        'token_count': {'$size': '$unique_tokens'}
+                }
+            },
+            {
+                # Roll up per ticker first so the token count is a group count, not a set
+                '$group': {
+                    '_id': '$ticker',
+                    'total_trades': {'$sum': 1},
+                    'total_profit': {'$sum': '$profit_usd'},
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'winning_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
+                        }
+                    },
+                    'best_trade': {'$max': '$profit_usd'},
+                    'worst_trade': {'$min': '$profit_usd'}
+                }
+            },
+            {
+                '$group': {
+                    '_id': None,
+                    'total_trades': {'$sum': '$total_trades'},
+                    'total_profit': {'$sum': '$total_profit'},
+                    'total_investment': {'$sum': '$total_investment'},
+                    'winning_trades': {'$sum': '$winning_trades'},
+                    'best_trade': {'$max': '$best_trade'},
+                    'worst_trade': {'$min': '$worst_trade'},
+                    'token_count': {'$sum': 1}
+                }
+            },
+            {
+                '$addFields': {
+                    'win_rate': {
+                        '$multiply': [
+                            {'$divide': ['$winning_trades', '$total_trades']},
+                            100
+                        ]
+                    },
+                    'roi': {
+                        '$multiply': [
+                            {'$divide': ['$total_profit', '$total_investment']},
+                            100
+                        ]
                     }
                 }
-            ]
-            result = list(self.pnls_collection.aggregate(pipeline))
-            return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error getting user monthly report: {e}")
-            return None
+            }
+        ]
+        result = list(self.pnls_collection.aggregate(pipeline, **_AGG_OPTS))
+        return result[0] if result else None
     
     # ===== PVP BATTLE SYSTEM METHODS =====
+    # These only absorb database errors (connection or operation failures); anything
+    # else is a bug and propagates instead of surfacing as an empty result
     
     def create_battle(self, battle_data: Dict[str, Any]) -> str:
         """Create a new PVP battle"""
         try:
-            # Ensure battles collection exists
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
             # Add timestamp
             battle_data['created_at'] = datetime.now(timezone.utc)
             battle_data['status'] = 'active'
+            # Store plain usernames so history lookups match the participants index directly
+            battle_data['participants'] = [
+                participant[1:] if participant.startswith('@') else participant
+                for participant in battle_data.get('participants', [])
+            ]
             
             result = self.battles_collection.insert_one(battle_data)
             battle_id = str(result.inserted_id)
             
             logger.info(f"Created new battle with ID: {battle_id}")
             return battle_id
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error creating battle: {e}")
             return None
     
     def get_active_battles(self) -> List[Dict[str, Any]]:
         """Get all active battles"""
         try:
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
             return list(self.battles_collection.find({'status': 'active'}))
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error getting active battles: {e}")
             return []
     
     def get_battle_by_id(self, battle_id: str) -> Optional[Dict[str, Any]]:
         """Get battle by ID"""
         try:
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
             return self.battles_collection.find_one({'_id': ObjectId(battle_id)})
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error getting battle by ID: {e}")
             return None
     
-    def update_battle_status(self, battle_id: str, status: str) -> bool:
-        """Update battle status"""
+    def update_battle_status(self, battle_id: str, status: str, now: Optional[datetime] = None) -> bool:
+        """Update battle status; now defaults to the current UTC time"""
         try:
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
             result = self.battles_collection.update_one(
                 {'_id': ObjectId(battle_id)},
-                {'$set': {'status': status, 'updated_at': datetime.now(timezone.utc)}}
+                {'$set': {'status': status, 'updated_at': now or datetime.now(timezone.utc)}}
             )
             return result.modified_count > 0
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error updating battle status: {e}")
             return False
     
@@ -1833,83 +2393,76 @@ class DatabaseManager:
         """Get current battle statistics"""
         try:
             battle = self.get_battle_by_id(battle_id)
-            if not battle:
-                return {}
-            
-            participants = battle.get('participants', [])
-            battle_type = battle.get('type', 'profit')
-            start_date = battle.get('start_date')
-            end_date = battle.get('end_date')
-            
-            # Get current stats for each participant
-            stats = {}
-            for participant in participants:
-                username = participant.replace('@', '')
-                
-                # Get trades within battle timeframe using enhanced username matching
-                user_match_query = self.create_username_match_query(username=username)
-                battle_match = {
-                    '$and': [
-                        user_match_query,
-                        {'timestamp': {'$gte': start_date, '$lte': end_date}}
-                    ]
+            return self._battle_stats(battle) if battle else {}
+        except PyMongoError as e:
+            logger.error(f"Error getting battle stats: {e}")
+            return {}
+    
+    def _battle_stats(self, battle: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Per-participant stats for a battle, keyed by display name in ranking order"""
+        participants = battle.get('participants', [])
+        score_field = 'total_profit_usd' if battle.get('type', 'profit') == 'profit' else 'total_trades'
+        start_date = battle.get('start_date')
+        end_date = battle.get('end_date')
+        
+        # Participants are keyed by their display name without @, matched by normalized username
+        names = {normalize_username(participant): participant.replace('@', '') for participant in participants}
+        pipeline = [
+            {
+                '$match': {
+                    'username_lc': {'$in': list(names)},
+                    'timestamp': {'$gte': start_date, '$lte': end_date}
                 }
-                
-                pipeline = [
-                    {
-                        '$match': battle_match
-                    },
-                    {
-                        '$group': {
-                            '_id': None,
-                            'total_trades': {'$sum': 1},
-                            'total_profit_usd': {'$sum': '$profit_usd'},
-                            'total_profit_sol': {'$sum': '$profit_sol'},
-                            'total_investment': {'$sum': '$initial_investment'},
-                            'winning_trades': {
-                                '$sum': {
-                                    '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
-                                }
-                            }
+            },
+            {
+                '$group': {
+                    '_id': '$username_lc',
+                    'total_trades': {'$sum': 1},
+                    'total_profit_usd': {'$sum': '$profit_usd'},
+                    'total_profit_sol': {'$sum': '$profit_sol'},
+                    'total_investment': {'$sum': '$initial_investment'},
+                    'winning_trades': {
+                        '$sum': {
+                            '$cond': [{'$gt': ['$profit_usd', 0]}, 1, 0]
                         }
                     }
-                ]
-                
-                result = list(self.pnls_collection.aggregate(pipeline))
-                if result:
-                    user_stats = result[0]
-                    user_stats['username'] = username
-                    user_stats['win_rate'] = (user_stats['winning_trades'] / user_stats['total_trades']) * 100 if user_stats['total_trades'] > 0 else 0
-                    
-                    if battle_type == 'profit':
-                        user_stats['score'] = user_stats['total_profit_usd']
-                    else:  # trade war
-                        user_stats['score'] = user_stats['total_trades']
-                    
-                    stats[username] = user_stats
-                else:
-                    stats[username] = {
-                        'username': username,
-                        'total_trades': 0,
-                        'total_profit_usd': 0,
-                        'total_profit_sol': 0,
-                        'total_investment': 0,
-                        'winning_trades': 0,
-                        'win_rate': 0,
-                        'score': 0
-                    }
-            
-            return stats
-        except Exception as e:
-            logger.error(f"Error getting battle stats: {e}")
-            return {}
+                }
+            },
+            {
+                '$addFields': {
+                    'win_rate': {'$multiply': [{'$divide': ['$winning_trades', '$total_trades']}, 100]},
+                    'score': f'${score_field}'
+                }
+            },
+            # Participants come back ranked, so callers never sort the stats themselves
+            {'$sort': {'score': -1}}
+        ]
+        
+        # Participants without trades in the window score 0, ranking above any net loss
+        idle = dict(names)
+        ranked = []
+        for row in self.pnls_collection.aggregate(pipeline, **_AGG_OPTS):
+            row['username'] = idle.pop(row.pop('_id'))
+            ranked.append(row)
+        insert_at = next((i for i, row in enumerate(ranked) if row['score'] < 0), len(ranked))
+        ranked[insert_at:insert_at] = [
+            {
+                'username': name,
+                'total_trades': 0,
+                'total_profit_usd': 0,
+                'total_profit_sol': 0,
+                'total_investment': 0,
+                'winning_trades': 0,
+                'win_rate': 0,
+                'score': 0
+            }
+            for name in idle.values()
+        ]
+        return {row['username']: row for row in ranked}
     
     def get_user_battle_points(self, username: str) -> Dict[str, Any]:
         """Get user's battle points and achievements"""
         try:
-            if not hasattr(self, 'battle_points_collection'):
-                self.battle_points_collection = self.db['battle_points']
-            
             # Try different username formats
             clean_username = username.replace('@', '') if username.startswith('@') else username
             
@@ -1930,104 +2483,84 @@ class DatabaseManager:
                     'win_rate': 0
                 }
             
-            return user_points
-        except Exception as e:
+            return _with_battle_win_rate(user_points)
+        except PyMongoError as e:
             logger.error(f"Error getting user battle points: {e}")
             return {}
     
-    def update_user_battle_points(self, username: str, battle_type: str, points: int, won: bool = False) -> bool:
-        """Update user's battle points"""
+    def update_user_battle_points(self, username: str, battle_type: str, points: int, won: bool = False,
+                                  now: Optional[datetime] = None) -> bool:
+        """Update user's battle points; now defaults to the current UTC time"""
         try:
-            if not hasattr(self, 'battle_points_collection'):
-                self.battle_points_collection = self.db['battle_points']
-            
-            update_data = {
-                '$inc': {
-                    'total_battles': 1
-                },
-                '$set': {
-                    'updated_at': datetime.now(timezone.utc)
-                }
-            }
-            
-            if battle_type == 'profit':
-                update_data['$inc']['profit_battle_points'] = points
-            else:  # trade war
-                update_data['$inc']['trade_war_points'] = points
-            
-            if won:
-                update_data['$inc']['battles_won'] = 1
-            
-            result = self.battle_points_collection.update_one(
+            # Counters and the combined total derived from them are written in one atomic pipeline update
+            self.battle_points_collection.update_one(
                 {'username': username},
-                update_data,
+                _battle_points_update(battle_type, points, won, now or datetime.now(timezone.utc)),
                 upsert=True
             )
-            
-            # Calculate new win rate
-            user_data = self.battle_points_collection.find_one({'username': username})
-            if user_data:
-                win_rate = (user_data['battles_won'] / user_data['total_battles']) * 100
-                self.battle_points_collection.update_one(
-                    {'username': username},
-                    {'$set': {'win_rate': win_rate}}
-                )
-            
+            self._drop_cached('battle_leaderboard')
             return True
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error updating user battle points: {e}")
             return False
     
+    def recompute_battle_points(self, usernames: Optional[List[str]] = None) -> int:
+        """Recompute stored battle totals for the given users (all when None) in one update; returns the number changed"""
+        try:
+            query = {'username': {'$in': usernames}} if usernames is not None else {}
+            # Also drops the win_rate older records stored, which is now derived on read
+            result = self.battle_points_collection.update_many(
+                query,
+                [
+                    {'$set': {'total_points': _BATTLE_TOTAL_POINTS_EXPR}},
+                    {'$project': {'win_rate': 0}}
+                ]
+            )
+            if result.modified_count:
+                self._drop_cached('battle_leaderboard')
+            return result.modified_count
+        except PyMongoError as e:
+            logger.error(f"Error recomputing battle points: {e}")
+            return 0
+    
     def get_battle_leaderboard(self, battle_type: str = 'all', limit: int = 10) -> List[Dict[str, Any]]:
         """Get battle points leaderboard"""
         try:
-            if not hasattr(self, 'battle_points_collection'):
-                self.battle_points_collection = self.db['battle_points']
-            
             if battle_type == 'profit':
                 sort_field = 'profit_battle_points'
             elif battle_type == 'trade':
                 sort_field = 'trade_war_points'
-            else:  # all - combined points
-                pipeline = [
-                    {
-                        '$addFields': {
-                            'total_points': {
-                                '$add': ['$profit_battle_points', '$trade_war_points']
-                            }
-                        }
-                    },
-                    {'$sort': {'total_points': -1}},
-                    {'$limit': limit}
+            else:  # all - combined points, stored on every update
+                sort_field = 'total_points'
+            
+            # Points only change when a battle completes, which drops these entries
+            return self._cached(
+                ('battle_leaderboard', sort_field, limit),
+                LEADERBOARD_CACHE_TTL,
+                lambda: [
+                    _with_battle_win_rate(points)
+                    # Range on the sort field's own index: users without points never enter the top-k walk
+                    for points in self.battle_points_collection.find(
+                        {sort_field: {'$gt': 0}}, _BATTLE_LEADERBOARD_PROJECTION
+                    ).sort(sort_field, -1).limit(limit)
                 ]
-                return list(self.battle_points_collection.aggregate(pipeline))
-            
-            return list(self.battle_points_collection.find({}).sort(sort_field, -1).limit(limit))
-        except Exception as e:
+            )
+        except PyMongoError as e:
             logger.error(f"Error getting battle leaderboard: {e}")
             return []
     
     def get_user_battle_history(self, username: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user's battle history"""
         try:
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
-            # Try different username formats for battle participation
-            clean_username = username.replace('@', '') if username.startswith('@') else username
-            
-            # Find battles where user participated (check multiple username formats)
+            # Participants are stored without the @, served by the (participants, created_at) index
+            clean_username = username[1:] if username.startswith('@') else username
             battles = list(self.battles_collection.find(
-                {
-                    'participants': {
-                        '$in': [username, f'@{clean_username}', clean_username]
-                    }
-                },
-                {'_id': 0}
+                {'participants': clean_username},
+                _BATTLE_HISTORY_PROJECTION
             ).sort('created_at', -1).limit(limit))
             
             return battles
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error getting user battle history: {e}")
             return []
     
@@ -2038,19 +2571,11 @@ class DatabaseManager:
             if not battle:
                 return {}
             
-            # Get final stats
-            final_stats = self.get_battle_stats(battle_id)
-            
-            # Determine winner and calculate points
+            # Final stats arrive already ranked by score
+            final_stats = self._battle_stats(battle)
             if not final_stats:
                 return {}
-            
-            # Sort participants by score
-            ranked_participants = sorted(
-                final_stats.items(),
-                key=lambda x: x[1]['score'],
-                reverse=True
-            )
+            ranked_participants = list(final_stats.items())
             
             # Award points based on ranking
             results = {
@@ -2060,23 +2585,18 @@ class DatabaseManager:
                 'rankings': []
             }
             
+            # One timestamp for every write belonging to this result
+            now = datetime.now(timezone.utc)
+            point_updates = []
             for rank, (username, stats) in enumerate(ranked_participants, 1):
-                # Calculate points based on rank
-                if rank == 1:
-                    points = 100  # Winner gets 100 points
-                    won = True
-                elif rank == 2:
-                    points = 75   # Second place gets 75 points
-                    won = False
-                elif rank == 3:
-                    points = 50   # Third place gets 50 points
-                    won = False
-                else:
-                    points = 25   # Participation points
-                    won = False
+                points = _RANK_POINTS[rank - 1] if rank <= len(_RANK_POINTS) else _PARTICIPATION_POINTS
+                won = rank == 1
                 
-                # Update user's battle points
-                self.update_user_battle_points(username, battle['type'], points, won)
+                point_updates.append(UpdateOne(
+                    {'username': username},
+                    _battle_points_update(battle['type'], points, won, now),
+                    upsert=True
+                ))
                 
                 results['rankings'].append({
                     'rank': rank,
@@ -2086,33 +2606,45 @@ class DatabaseManager:
                     'stats': stats
                 })
             
+            # Every participant's points in one round trip
+            if point_updates:
+                self.battle_points_collection.bulk_write(point_updates, ordered=False)
+                self._drop_cached('battle_leaderboard')
+            
             # Update battle status
-            self.update_battle_status(battle_id, 'completed')
+            self.update_battle_status(battle_id, 'completed', now)
             
             return results
-        except Exception as e:
+        except PyMongoError as e:
             logger.error(f"Error completing battle: {e}")
             return {}
     
+    def iter_expired_battles(self, batch_size: int = 50) -> Iterator[Dict[str, Any]]:
+        """Stream battles that have expired and need to be completed, buffering at most batch_size at a time"""
+        query = {'status': 'active', 'end_date': {'$lt': datetime.now(timezone.utc)}}
+        # Pin the (status, end_date) index so a cold plan cache never falls back to a scan
+        return self._hinted(
+            lambda **options: _started(self.battles_collection.find(query, batch_size=batch_size, **options)),
+            hint=[('status', 1), ('end_date', 1)]
+        )
+    
     def get_expired_battles(self) -> List[Dict[str, Any]]:
-        """Get battles that have expired and need to be completed"""
+        """Get battles that have expired and need to be completed (loads them all; prefer iter_expired_battles)"""
         try:
-            if not hasattr(self, 'battles_collection'):
-                self.battles_collection = self.db['battles']
-            
-            now = datetime.now(timezone.utc)
-            return list(self.battles_collection.find({
-                'status': 'active',
-                'end_date': {'$lt': now}
-            }))
-        except Exception as e:
+            return list(self.iter_expired_battles())
+        except PyMongoError as e:
             logger.error(f"Error getting expired battles: {e}")
             return []
     
     def close_connection(self):
         """Close database connection"""
         if self.client:
-            self.client.close()
+            with self._refresh_lock:
+                if self._refresh_timer:
+                    self._refresh_timer.cancel()
+                # A refresh still running sees this and does not schedule another
+                self.client = None
+            _close_client(self.host, self.port)
             logger.info("MongoDB connection closed")
 
 
@@ -16,6 +16,9 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Collections the bot derives from the PNL records and rebuilds itself on connect
+DERIVED_COLLECTIONS = ('pnl_rollups', 'global_stats', 'leaderboards')
+
 class DateTimeEncoder(json.JSONEncoder):
     """Custom JSON encoder for datetime and ObjectId objects"""
     def default(self, obj):
@@ -46,7 +49,7 @@ def export_database():
     db = client['telegram']
     
     # Get all collections
-    collections = db.list_collection_names()
+    collections = [name for name in db.list_collection_names() if name not in DERIVED_COLLECTIONS]
     logger.info(f"Found collections: {collections}")
     
     # Export each collection
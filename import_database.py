@@ -16,6 +16,9 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Collections the bot derives from the PNL records and rebuilds itself on connect
+DERIVED_COLLECTIONS = ('pnl_rollups', 'global_stats', 'leaderboards')
+
 def parse_datetime(date_string):
     """Parse datetime string from export"""
     try:
@@ -84,6 +87,10 @@ def import_database():
     
     # Import each collection
     for collection_name in metadata['collections']:
+        if collection_name in DERIVED_COLLECTIONS:
+            logger.info(f"Skipping derived collection: {collection_name}")
+            continue
+        
         logger.info(f"Importing collection: {collection_name}")
         
         json_file = backup_dir / f"{collection_name}.json"
@@ -122,6 +129,11 @@ def import_database():
             logger.error(f"Error importing collection {collection_name}: {e}")
             continue
     
+    # Drop the derived collections so the bot rebuilds them from the imported trades
+    for collection_name in DERIVED_COLLECTIONS:
+        db[collection_name].drop()
+    logger.info("Dropped derived collections; the bot rebuilds them on its next connect")
+    
     # Verify import
     logger.info("Verifying import...")
     for collection_name in metadata['collections']:
@@ -19,6 +19,9 @@ import hashlib
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Collections the bot derives from the PNL records and rebuilds itself on connect
+DERIVED_COLLECTIONS = ('pnl_rollups', 'global_stats', 'leaderboards')
+
 class DatabaseSynchronizer:
     def __init__(self, database_name="telegram"):
         self.database_name = database_name
@@ -63,8 +66,8 @@ class DatabaseSynchronizer:
         export_path.parent.mkdir(exist_ok=True)
         
         try:
-            # Get all collections
-            collections = self.db.list_collection_names()
+            # Get all collections except the derived ones, which are rebuilt from the merged trades
+            collections = [name for name in self.db.list_collection_names() if name not in DERIVED_COLLECTIONS]
             export_data = {
                 "export_timestamp": datetime.now(timezone.utc).isoformat(),
                 "database_name": self.database_name,
@@ -128,6 +131,8 @@ class DatabaseSynchronizer:
             
             for collection_name in set(list(remote_data.get("collections", {}).keys()) + 
                                      list(local_data.get("collections", {}).keys())):
+                if collection_name in DERIVED_COLLECTIONS:
+                    continue
                 
                 remote_docs = remote_data.get("collections", {}).get(collection_name, [])
                 local_docs = local_data.get("collections", {}).get(collection_name, [])
@@ -139,6 +144,8 @@ class DatabaseSynchronizer:
                 if merged_docs:
                     self.update_collection(collection_name, merged_docs)
             
+            self.drop_derived_collections()
+            
             # Generate merge report
             self.generate_merge_report(merge_stats)
             
@@ -248,6 +255,12 @@ class DatabaseSynchronizer:
         
         return resolved_doc
     
+    def drop_derived_collections(self):
+        """Drop the rollup and leaderboard collections so the bot rebuilds them from the merged trades"""
+        for collection_name in DERIVED_COLLECTIONS:
+            self.db[collection_name].drop()
+        logger.info("Dropped derived collections; the bot rebuilds them on its next connect")
+    
     def update_collection(self, collection_name, documents):
         """Update collection with merged documents"""
         try:
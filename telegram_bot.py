@@ -72,6 +72,10 @@ def parse_channel_config(channel_config):
 
 CHANNELS_TO_POST = parse_channel_config(CHANNEL_IDS if CHANNEL_IDS else ([CHANNEL_ID] if CHANNEL_ID else []))
 
+def frame_from_batches(frames):
+    """Join per-batch DataFrames into one, or an empty DataFrame when there were no records"""
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
 class TelegramPNLBot:
     def __init__(self):
         self.application = None
@@ -184,10 +188,10 @@ Ready to track your trading journey? Start with `/submit`! 🚀
         """Show quick community summary"""
         try:
             # Get essential data
-            total_data = db_manager.get_total_profit_combined()
+            total_data = await asyncio.to_thread(db_manager.get_total_profit_combined)
             user_id = update.effective_user.id
             username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
-            user_stats = db_manager.get_user_stats(user_id, username)
+            user_stats = await asyncio.to_thread(db_manager.get_user_stats, user_id, username)
             
             if not total_data:
                 await self.safe_reply(update, "📊 No community data available yet.")
@@ -690,14 +694,16 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
                 'screenshot_file_id': session_data.get('screenshot', '')
             }
             
-            # Save to database
-            success = db_manager.insert_pnl_record(db_record)
+            # Write the record now, so the stats in the summary include this trade and a failed
+            # write is reported to the user instead of being left to the background queue
+            written = await asyncio.to_thread(db_manager.insert_pnl_records, [db_record])
             
-            if success:
+            if written == 1:
                 # Create clean final post with image and data FIRST
                 photo_file_id = session_data.get('screenshot')
-                channel_message = message_formatter.format_submission_message(
-                    session_data, currency_converter
+                # The summary looks up stats and achievements, so build it off the event loop
+                channel_message = await asyncio.to_thread(
+                    message_formatter.format_submission_message, session_data, currency_converter
                 )
                 
                 # Send clean final post to user
@@ -856,7 +862,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
     async def leaderboard_command(self, update: Update, context) -> None:
         """Show enhanced all-time leaderboard with improved calculations"""
         try:
-            leaders = db_manager.get_all_time_leaderboard()
+            leaders = await asyncio.to_thread(db_manager.get_all_time_leaderboard)
             
             if not leaders:
                 await self.safe_reply(update, "📊 No leaderboard data available yet.")
@@ -917,7 +923,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
             # Get current date info
             now = datetime.now(timezone.utc)
             year, month = date_helper.get_current_month_year()
-            leaders = db_manager.get_monthly_leaderboard(year, month)
+            leaders = await asyncio.to_thread(db_manager.get_monthly_leaderboard, year, month)
             
             month_names = ["", "January", "February", "March", "April", "May", "June",
                           "July", "August", "September", "October", "November", "December"]
@@ -1006,7 +1012,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
         try:
             # Get current week date range
             start_date, end_date = date_helper.get_current_week_range()
-            leaders = db_manager.get_weekly_leaderboard(start_date, end_date)
+            leaders = await asyncio.to_thread(db_manager.get_weekly_leaderboard, start_date, end_date)
             
             # Create enhanced leaderboard
             if not leaders:
@@ -1094,7 +1100,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
         try:
             # Get current date
             today = datetime.now(timezone.utc)
-            leaders = db_manager.get_daily_leaderboard(today)
+            leaders = await asyncio.to_thread(db_manager.get_daily_leaderboard, today)
             
             # Create enhanced leaderboard
             if not leaders:
@@ -1182,7 +1188,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
         try:
             # Get current week date range
             start_date, end_date = date_helper.get_current_week_range()
-            leaders = db_manager.get_trade_count_leaderboard(start_date, end_date)
+            leaders = await asyncio.to_thread(db_manager.get_trade_count_leaderboard, start_date, end_date)
             
             # Create enhanced leaderboard
             if not leaders:
@@ -1277,7 +1283,7 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
     
     async def profit_goat_command(self, update: Update, context) -> None:
         """Show the profit GOAT"""
-        goat_data = db_manager.get_profit_goat()
+        goat_data = await asyncio.to_thread(db_manager.get_profit_goat)
         if not goat_data:
             await update.message.reply_text("📊 No profit GOAT data available yet.")
             return
@@ -1293,19 +1299,20 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
             return
         
         try:
-            # Get all PNL data
-            data = db_manager.get_all_pnl_data()
+            # Report columns, in display order; only these fields are read from the database
+            column_order = ['username', 'ticker', 'initial_investment', 'profit_usd', 'profit_sol', 
+                          'currency', 'timestamp', 'is_historical']
             
-            if not data:
-                await update.message.reply_text("📄 No PNL data available for export.")
+            # Read the report fields in batches; only the current batch is held as raw documents
+            frames = await asyncio.to_thread(db_manager.map_all_pnl_batches, pd.DataFrame, column_order)
+            if frames is None:
+                await update.message.reply_text("❌ Error generating report. Please try again later.")
                 return
+            df = await asyncio.to_thread(frame_from_batches, frames)
             
-            # Create DataFrame and CSV
-            df = pd.DataFrame(data)
-            
-            # Reorder columns for better readability
-            column_order = ['username', 'ticker', 'initial_investment', 'profit_usd', 'profit_sol', 
-                          'currency', 'timestamp', 'is_historical']
+            if df.empty:
+                await update.message.reply_text("📄 No PNL data available for export.")
+                return
             
             # Only include columns that exist
             available_columns = [col for col in column_order if col in df.columns]
@@ -1342,45 +1349,10 @@ Set `TEST_MODE=true` in .env OR add this chat ID to `TEST_CHAT_IDS`
             username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
             
             # Get user's trading stats with enhanced matching
-            stats = db_manager.get_user_stats(str(user_id), username)
+            stats = await asyncio.to_thread(db_manager.get_user_stats, str(user_id), username)
             
             if not stats:
-                # Try to find user with direct database query for debugging
-                debug_conditions = db_manager.create_username_match_conditions(str(user_id), username)
-                debug_query = list(db_manager.pnls_collection.find({
-                    '$or': debug_conditions
-                }).limit(5))
-                
-                if debug_query:
-                    # Show debug info about found trades
-                    trade_usernames = [trade.get('username', 'N/A') for trade in debug_query]
-                    trade_user_ids = [trade.get('user_id', 'N/A') for trade in debug_query]
-                    
-                    debug_message = f"""
-🔍 **DEBUG INFO** 🔍
-
-**Found {len(debug_query)} trades but stats calculation failed:**
-
-**Your Info:**
-• User ID: `{user_id}`
-• Username: `{username}`
-
-**Found Trades:**
-• Trade Usernames: {trade_usernames}
-• Trade User IDs: {trade_user_ids}
-
-**Possible Issues:**
-• Username format mismatch (@ symbol)
-• User ID type mismatch (string vs number)
-• Database aggregation error
-
-Please contact admin with this debug info.
-                    """.strip()
-                    
-                    await self.safe_reply(update, debug_message, parse_mode=ParseMode.MARKDOWN)
-                    logger.warning(f"Found {len(debug_query)} trades for user {username} (ID: {user_id}) but stats calculation failed. Trade usernames: {trade_usernames}, Trade user_ids: {trade_user_ids}")
-                else:
-                    await self.safe_reply(update, "📊 No trading data found for your account. Use `/submit` to add your first trade!")
+                await self.safe_reply(update, "📊 No trading data found for your account. Use `/submit` to add your first trade!")
                 return
             
             # Enhanced stats message formatting
@@ -1442,7 +1414,7 @@ Please contact admin with this debug info.
             
             # Get user's leaderboard position
             try:
-                all_leaders = db_manager.get_all_time_leaderboard(100)
+                all_leaders = await asyncio.to_thread(db_manager.get_all_time_leaderboard, 100)
                 user_rank = None
                 for i, leader in enumerate(all_leaders, 1):
                     if (leader.get('username', '').lower() == username.lower() or 
@@ -1487,7 +1459,7 @@ Please contact admin with this debug info.
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
         # Get user's trading history
-        history = db_manager.get_user_history(user_id, username)
+        history = await asyncio.to_thread(db_manager.get_user_history, user_id, username)
         
         if not history:
             await self.safe_reply(update, "📈 No trading history found for your account.")
@@ -1507,8 +1479,8 @@ Please contact admin with this debug info.
         user2_name = context.args[0].replace('@', '')
         
         # Get stats for both users
-        user1_stats = db_manager.get_user_stats(user1_id, user1_name)
-        user2_stats = db_manager.get_user_stats_by_username(user2_name)
+        user1_stats = await asyncio.to_thread(db_manager.get_user_stats, user1_id, user1_name)
+        user2_stats = await asyncio.to_thread(db_manager.get_user_stats_by_username, user2_name)
         
         if not user1_stats:
             await update.message.reply_text("📊 You don't have any trading data yet. Use `/submit` to add trades!")
@@ -1523,7 +1495,7 @@ Please contact admin with this debug info.
     
     async def roi_command(self, update: Update, context) -> None:
         """Show ROI-based leaderboard"""
-        leaders = db_manager.get_roi_leaderboard()
+        leaders = await asyncio.to_thread(db_manager.get_roi_leaderboard)
         
         title = "🚀 ROI Leaderboard (Best Returns)"
         message = message_formatter.format_roi_leaderboard_message(title, leaders)
@@ -1533,7 +1505,7 @@ Please contact admin with this debug info.
     
     async def tokenleader_command(self, update: Update, context) -> None:
         """Show most profitable tokens"""
-        token_stats = db_manager.get_token_leaderboard()
+        token_stats = await asyncio.to_thread(db_manager.get_token_leaderboard)
         
         if not token_stats:
             await update.message.reply_text("📊 No token data available yet.")
@@ -1549,7 +1521,7 @@ Please contact admin with this debug info.
             return
         
         ticker = context.args[0].upper()
-        stats = db_manager.get_token_stats(ticker)
+        stats = await asyncio.to_thread(db_manager.get_token_stats, ticker)
         
         if not stats:
             await update.message.reply_text(f"📊 No trading data found for {ticker}")
@@ -1560,7 +1532,7 @@ Please contact admin with this debug info.
     
     async def trendingcoins_command(self, update: Update, context) -> None:
         """Show most traded tokens this week/month"""
-        trending = db_manager.get_trending_tokens()
+        trending = await asyncio.to_thread(db_manager.get_trending_tokens)
         
         if not trending:
             await update.message.reply_text("📊 No trending token data available.")
@@ -1573,7 +1545,7 @@ Please contact admin with this debug info.
     
     async def bigballer_command(self, update: Update, context) -> None:
         """Show highest investment amounts (whale tracker)"""
-        whales = db_manager.get_whale_leaderboard()
+        whales = await asyncio.to_thread(db_manager.get_whale_leaderboard)
         
         title = "🐋 Big Baller Leaderboard (Highest Investments)"
         message = message_formatter.format_whale_leaderboard_message(title, whales)
@@ -1581,7 +1553,7 @@ Please contact admin with this debug info.
     
     async def percentking_command(self, update: Update, context) -> None:
         """Show best percentage gains"""
-        leaders = db_manager.get_percent_gain_leaderboard()
+        leaders = await asyncio.to_thread(db_manager.get_percent_gain_leaderboard)
         
         title = "👑 Percent King Leaderboard (Best % Gains)"
         message = message_formatter.format_percent_leaderboard_message(title, leaders)
@@ -1589,7 +1561,7 @@ Please contact admin with this debug info.
     
     async def consistenttrader_command(self, update: Update, context) -> None:
         """Show most consistent profitable traders"""
-        traders = db_manager.get_consistency_leaderboard()
+        traders = await asyncio.to_thread(db_manager.get_consistency_leaderboard)
         
         title = "🎯 Consistent Trader Leaderboard"
         message = message_formatter.format_consistency_leaderboard_message(title, traders)
@@ -1597,7 +1569,7 @@ Please contact admin with this debug info.
     
     async def lossleader_command(self, update: Update, context) -> None:
         """Show transparency leaderboard (biggest losses)"""
-        leaders = db_manager.get_loss_leaderboard()
+        leaders = await asyncio.to_thread(db_manager.get_loss_leaderboard)
         
         title = "😅 Transparency Leaderboard (Lessons Learned)"
         message = message_formatter.format_loss_leaderboard_message(title, leaders)
@@ -1605,7 +1577,7 @@ Please contact admin with this debug info.
     
     async def smallcap_command(self, update: Update, context) -> None:
         """Show leaderboard for investments under $100"""
-        leaders = db_manager.get_investment_filtered_leaderboard(max_investment=100)
+        leaders = await asyncio.to_thread(db_manager.get_investment_filtered_leaderboard, max_investment=100)
         
         title = "💰 Small Cap Leaderboard (Under $100)"
         message = message_formatter.format_leaderboard_message(title, leaders, currency_converter)
@@ -1613,7 +1585,7 @@ Please contact admin with this debug info.
     
     async def midcap_command(self, update: Update, context) -> None:
         """Show leaderboard for investments $100-$1000"""
-        leaders = db_manager.get_investment_filtered_leaderboard(min_investment=100, max_investment=1000)
+        leaders = await asyncio.to_thread(db_manager.get_investment_filtered_leaderboard, min_investment=100, max_investment=1000)
         
         title = "💎 Mid Cap Leaderboard ($100-$1000)"
         message = message_formatter.format_leaderboard_message(title, leaders, currency_converter)
@@ -1621,7 +1593,7 @@ Please contact admin with this debug info.
     
     async def largecap_command(self, update: Update, context) -> None:
         """Show leaderboard for investments over $1000"""
-        leaders = db_manager.get_investment_filtered_leaderboard(min_investment=1000)
+        leaders = await asyncio.to_thread(db_manager.get_investment_filtered_leaderboard, min_investment=1000)
         
         title = "🐋 Large Cap Leaderboard (Over $1000)"
         message = message_formatter.format_leaderboard_message(title, leaders, currency_converter)
@@ -1634,7 +1606,7 @@ Please contact admin with this debug info.
         user_id = update.effective_user.id
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
-        achievements = db_manager.get_user_achievements(user_id, username)
+        achievements = await asyncio.to_thread(db_manager.get_user_achievements, user_id, username)
         message = message_formatter.format_achievements_message(achievements, username)
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
     
@@ -1643,7 +1615,7 @@ Please contact admin with this debug info.
         user_id = update.effective_user.id
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
-        streaks = db_manager.get_user_streaks(user_id, username)
+        streaks = await asyncio.to_thread(db_manager.get_user_streaks, user_id, username)
         message = message_formatter.format_streaks_message(streaks, username)
         await self.safe_reply(update, message, parse_mode=ParseMode.MARKDOWN)
         await self.clean_command_message(update, context)
@@ -1653,13 +1625,13 @@ Please contact admin with this debug info.
         user_id = update.effective_user.id
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
-        milestones = db_manager.get_user_milestones(user_id, username)
+        milestones = await asyncio.to_thread(db_manager.get_user_milestones, user_id, username)
         message = message_formatter.format_milestones_message(milestones, username)
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
     
     async def randomtrade_command(self, update: Update, context) -> None:
         """Show random successful trade for inspiration"""
-        trade = db_manager.get_random_successful_trade()
+        trade = await asyncio.to_thread(db_manager.get_random_successful_trade)
         
         if not trade:
             await update.message.reply_text("📊 No successful trades found for inspiration.")
@@ -1671,7 +1643,7 @@ Please contact admin with this debug info.
     async def todaysbiggest_command(self, update: Update, context) -> None:
         """Show biggest winner today"""
         today = datetime.now(timezone.utc)
-        winner = db_manager.get_daily_biggest_winner(today)
+        winner = await asyncio.to_thread(db_manager.get_daily_biggest_winner, today)
         
         if not winner:
             await update.message.reply_text("📊 No trades recorded for today yet.")
@@ -1684,7 +1656,7 @@ Please contact admin with this debug info.
         """Show all-time legends with special recognition across multiple categories"""
         try:
             # Get legends from database
-            legends = db_manager.get_hall_of_fame()
+            legends = await asyncio.to_thread(db_manager.get_hall_of_fame)
             
             if not legends:
                 no_legends_message = """
@@ -1732,14 +1704,14 @@ Please contact admin with this debug info.
     
     async def marketsentiment_command(self, update: Update, context) -> None:
         """Show community sentiment analysis"""
-        sentiment = db_manager.get_market_sentiment()
+        sentiment = await asyncio.to_thread(db_manager.get_market_sentiment)
         
         message = message_formatter.format_market_sentiment_message(sentiment)
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
     
     async def popularityindex_command(self, update: Update, context) -> None:
         """Show most frequently traded tokens"""
-        popularity = db_manager.get_token_popularity()
+        popularity = await asyncio.to_thread(db_manager.get_token_popularity)
         
         message = message_formatter.format_popularity_index_message(popularity)
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -1751,7 +1723,7 @@ Please contact admin with this debug info.
             return
         
         ticker = context.args[0].upper()
-        profitability = db_manager.get_token_profitability(ticker)
+        profitability = await asyncio.to_thread(db_manager.get_token_profitability, ticker)
         
         if not profitability:
             await update.message.reply_text(f"📊 No profitability data found for {ticker}")
@@ -1762,7 +1734,7 @@ Please contact admin with this debug info.
     
     async def timetrendz_command(self, update: Update, context) -> None:
         """Show best performing times/days for trades"""
-        trends = db_manager.get_time_trends()
+        trends = await asyncio.to_thread(db_manager.get_time_trends)
         
         message = message_formatter.format_time_trends_message(trends)
         await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
@@ -1812,7 +1784,7 @@ Please contact admin with this debug info.
             return
         
         ticker = context.args[0].upper()
-        trades = db_manager.search_trades_by_ticker(ticker)
+        trades = await asyncio.to_thread(db_manager.search_trades_by_ticker, ticker)
         
         if not trades:
             await update.message.reply_text(f"🔍 No trades found for {ticker}")
@@ -1828,7 +1800,7 @@ Please contact admin with this debug info.
             return
         
         username = context.args[0].replace('@', '')
-        trades = db_manager.search_trades_by_username(username)
+        trades = await asyncio.to_thread(db_manager.search_trades_by_username, username)
         
         if not trades:
             await update.message.reply_text(f"🔍 No trades found for @{username}")
@@ -1845,7 +1817,7 @@ Please contact admin with this debug info.
             await update.message.reply_text("❓ Usage: `/topgainer [today|week|month]`\nExample: `/topgainer week`")
             return
         
-        gainer = db_manager.get_top_gainer(period)
+        gainer = await asyncio.to_thread(db_manager.get_top_gainer, period)
         
         if not gainer:
             await update.message.reply_text(f"📊 No data available for {period}")
@@ -1864,14 +1836,18 @@ Please contact admin with this debug info.
         
         # This is the same as pnl_report but for personal data
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
-        data = db_manager.get_user_export_data(user_id, username)
+        # Read the user's trades in batches; only the current batch is held as raw documents
+        frames = await asyncio.to_thread(db_manager.map_user_export_batches, user_id, username, pd.DataFrame)
+        if frames is None:
+            await update.message.reply_text("❌ Error exporting your data. Please try again later.")
+            return
+        df = await asyncio.to_thread(frame_from_batches, frames)
         
-        if not data:
+        if df.empty:
             await update.message.reply_text("📄 No personal trading data available for export.")
             return
         
-        # Create DataFrame and CSV
-        df = pd.DataFrame(data)
+        # Create CSV
         csv_buffer = BytesIO()
         df.to_csv(csv_buffer, index=False)
         csv_buffer.seek(0)
@@ -1893,7 +1869,7 @@ Please contact admin with this debug info.
         user_id = update.effective_user.id
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
-        portfolio = db_manager.get_user_portfolio(user_id, username)
+        portfolio = await asyncio.to_thread(db_manager.get_user_portfolio, user_id, username)
         
         if not portfolio:
             await update.message.reply_text("📊 No portfolio data available. Use `/submit` to add trades!")
@@ -1911,7 +1887,7 @@ Please contact admin with this debug info.
         now = datetime.now(timezone.utc)
         start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        report = db_manager.get_user_monthly_report(user_id, username, start_date)
+        report = await asyncio.to_thread(db_manager.get_user_monthly_report, user_id, username, start_date)
         
         if not report:
             await update.message.reply_text("📊 No trading data for this month yet.")
@@ -2077,7 +2053,7 @@ Ready to track your trading journey? Start with a screenshot! 📸
         """Show total combined profit across all trades"""
         try:
             # Get total profit data
-            total_data = db_manager.get_total_profit_combined()
+            total_data = await asyncio.to_thread(db_manager.get_total_profit_combined)
             
             if not total_data:
                 await self.safe_reply(update, "📊 No trading data available yet.")
@@ -2339,7 +2315,7 @@ Type `/profitbattle` or `/tradewar` to get started!
         username = update.effective_user.username or update.effective_user.first_name or f"User{user_id}"
         
         # Get user's battle stats
-        battle_stats = db_manager.get_user_battle_points(username)
+        battle_stats = await asyncio.to_thread(db_manager.get_user_battle_points, username)
         
         if not battle_stats:
             await update.message.reply_text(
@@ -2361,7 +2337,7 @@ Type `/profitbattle` or `/tradewar` to get started!
         win_rate = (battles_won / battles_participated * 100) if battles_participated > 0 else 0
         
         # Determine rank based on points
-        leaderboard = db_manager.get_battle_leaderboard()
+        leaderboard = await asyncio.to_thread(db_manager.get_battle_leaderboard)
         rank = 'Unranked'
         total_points = battle_stats.get('profit_battle_points', 0) + battle_stats.get('trade_war_points', 0)
         for i, user in enumerate(leaderboard, 1):
@@ -2410,7 +2386,7 @@ Type `/profitbattle` or `/tradewar` to get started!
         """Show battle points leaderboard"""
         try:
             # Get battle leaderboard
-            leaderboard = db_manager.get_battle_leaderboard()
+            leaderboard = await asyncio.to_thread(db_manager.get_battle_leaderboard)
             
             if not leaderboard:
                 await update.message.reply_text(
@@ -2842,7 +2818,7 @@ Type `/profitbattle` or `/tradewar` to get started!
             'end_date': datetime.now(timezone.utc) + timedelta(minutes=duration_minutes)
         }
         
-        battle_id = db_manager.create_battle(battle_data)
+        battle_id = await asyncio.to_thread(db_manager.create_battle, battle_data)
         
         if not battle_id:
             await query.edit_message_text("❌ Failed to create battle. Please try again.")
@@ -3256,7 +3232,7 @@ Type `/profitbattle` or `/tradewar` to get started!
             'end_date': datetime.now(timezone.utc) + timedelta(minutes=duration_minutes)
         }
         
-        battle_id = db_manager.create_battle(battle_data)
+        battle_id = await asyncio.to_thread(db_manager.create_battle, battle_data)
         
         if not battle_id:
             await query.edit_message_text("❌ Failed to create trade war. Please try again.")
@@ -3575,13 +3551,17 @@ Type `/profitbattle` or `/tradewar` to get started!
     async def check_battle_completions(self, context):
         """Check for expired battles and complete them"""
         try:
-            expired_battles = db_manager.get_expired_battles()
+            # Pull expired battles one at a time off the cursor rather than loading them all
+            expired_battles = await asyncio.to_thread(db_manager.iter_expired_battles)
             
-            for battle in expired_battles:
+            while True:
+                battle = await asyncio.to_thread(next, expired_battles, None)
+                if battle is None:
+                    break
                 battle_id = str(battle['_id'])
                 
                 # Complete the battle
-                results = db_manager.complete_battle(battle_id)
+                results = await asyncio.to_thread(db_manager.complete_battle, battle_id)
                 
                 if results:
                     # Create victory announcement
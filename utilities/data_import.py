@@ -263,9 +263,15 @@ class DataImporter:
                 delete_result = db_manager.pnls_collection.delete_many({'is_historical': True})
                 logger.info(f"Deleted {delete_result.deleted_count} existing historical records")
             
-            # Insert new records
-            result = db_manager.pnls_collection.insert_many(records)
-            self.processed_count = len(result.inserted_ids)
+            # Insert new records (derived fields and rollups are handled by the batch path)
+            self.processed_count = db_manager.insert_pnl_records(records)
+            if self.processed_count != len(records):
+                logger.error(f"Only {self.processed_count} of {len(records)} historical records were written")
+                return False
+            
+            if existing_count > 0:
+                # The deleted records are still counted in the per-user rollups
+                db_manager.rebuild_rollups()
             
             logger.info(f"Successfully imported {self.processed_count} historical records")
             return True
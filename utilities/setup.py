@@ -166,7 +166,7 @@ def test_configuration():
         
         # Test database connection
         from database import db_manager
-        if db_manager.connect():
+        if db_manager.connect() and db_manager.health_check():
             print("✅ Database connection successful")
             db_manager.close_connection()
         else:
@@ -227,13 +227,15 @@ class MessageFormatter:
             if not db_manager:
                 raise ImportError("Database manager not available")
             
-            user_stats = db_manager.get_user_stats(user_id, username)
-            if user_stats:
+            profile = db_manager.get_user_profile_bundle(user_id, username)
+            if profile:
+                user_stats = profile['stats']
+                
                 # === ACHIEVEMENT-FOCUSED SECTION ===
                 message += f"\n🏆 **ACHIEVEMENT STATUS** 🏆\n"
                 
                 # Check for new achievements
-                achievements = db_manager.get_user_achievements(user_id, username)
+                achievements = profile['achievements']
                 total_achievements = achievements.get('total_achievements', 0)
                 
                 # Show key achievements
@@ -246,7 +248,7 @@ class MessageFormatter:
                     message += f"🎯 **First Achievement**: {achievements.get('next_milestone', 'Keep trading!')}\n"
                 
                 # Streak information
-                streaks = db_manager.get_user_streaks(user_id, username)
+                streaks = profile['streaks']
                 current_streak = streaks.get('current_streak', 0)
                 streak_type = streaks.get('streak_type', 'neutral')
                 
@@ -255,7 +257,7 @@ class MessageFormatter:
                     message += f"{streak_emoji} **Current Streak**: {current_streak} {streak_type}\n"
                 
                 # Milestone progress
-                milestones = db_manager.get_user_milestones(user_id, username)
+                milestones = profile['milestones']
                 next_milestone = milestones.get('next_milestone', 'Keep trading!')
                 progress = milestones.get('progress', 0)
                 
@@ -582,7 +584,7 @@ class MessageFormatter:
         
         for i, leader in enumerate(leaders, 1):
             emoji = "😭" if i == 1 else "😔" if i == 2 else "😅" if i == 3 else f"{i}."
-            username = leader.get('username', f"User {leader['_id']}")
+            username = leader.get('username', 'Unknown')
             loss = abs(leader.get('profit_usd', 0))
             ticker = leader.get('ticker', 'N/A')
             